@@ -0,0 +1,105 @@
+"""Levels of detail for the animated actors. The reduced meshes are generated
+by the asset cooker, farther away actors will also be animated less often and
+without frame blending."""
+import logging
+from direct.actor.Actor import Actor
+
+# the levels of detail with the distance range they are shown in, the models
+# of the lower levels are named <model>-<level>
+LODS = [
+    ("high", 0.0, 15.0),
+    ("medium", 15.0, 30.0),
+    ("low", 30.0, 1000.0)]
+# distances between which the animation updates get less frequent
+ANIMNEAR = 15.0
+ANIMFAR = 40.0
+# the delay factor between the animation updates at the far distance
+ANIMDELAY = 0.5
+
+
+def loadActor(modelName, animations):
+    """Create an actor with all levels of detail of the given model. If the
+    reduced models haven't been cooked, the actor will only have the full
+    model."""
+    models = {LODS[0][0]: modelName}
+    for lodName, near, far in LODS[1:]:
+        name = "%s-%s" % (modelName, lodName)
+        if loader.loadModel(name, okMissing=True) is None:
+            logging.info("no levels of detail found for %s" % modelName)
+            return Actor(modelName, animations)
+        models[lodName] = name
+    actor = Actor()
+    actor.setLODNode()
+    for lodName, near, far in LODS:
+        actor.addLOD(lodName, far, near)
+        actor.loadModel(models[lodName], lodName=lodName)
+    actor.loadAnims(animations, lodName="all")
+    actor.setLODAnimation(ANIMFAR, ANIMNEAR, ANIMDELAY)
+    return actor
+
+
+def getJointLOD(actor):
+    """Return the name of the level of detail to expose joints of"""
+    if actor.hasLOD():
+        return LODS[0][0]
+    return "lodRoot"
+
+
+class ActorLOD():
+    """Switch the frame blending of the actors off when they are far away and
+    scale the distances of all their levels of detail"""
+    # time in seconds between the updates
+    UPDATEINTERVAL = 0.25
+    # actors farther away than this won't use frame blending
+    BLENDDISTANCE = 15.0
+
+    def __init__(self):
+        self.actors = {}
+        self.scale = 1.0
+        self.frameBlend = True
+
+    def addActor(self, actor):
+        self.actors[actor] = None
+        if actor.hasLOD():
+            actor.getLODNode().node().setLodScale(self.scale)
+
+    def removeActor(self, actor):
+        if actor not in self.actors: return
+        del self.actors[actor]
+        actor.setBlend(frameBlend=True)
+        if actor.hasLOD():
+            actor.getLODNode().node().setLodScale(1.0)
+
+    def setScale(self, scale):
+        """Scale all switch distances, values below one will show the lower
+        levels of detail earlier"""
+        self.scale = scale
+        for actor in self.actors.keys():
+            if actor.hasLOD():
+                actor.getLODNode().node().setLodScale(scale)
+
+    def setFrameBlend(self, frameBlend):
+        """Enable or disable frame blending for the near actors"""
+        self.frameBlend = frameBlend
+        for actor in self.actors.keys():
+            self.actors[actor] = None
+
+    def start(self):
+        taskMgr.doMethodLater(
+            ActorLOD.UPDATEINTERVAL, self.update, "actorLODTask")
+
+    def stop(self):
+        taskMgr.remove("actorLODTask")
+        for actor in self.actors.keys():
+            self.removeActor(actor)
+
+    def update(self, task):
+        blendDistance = ActorLOD.BLENDDISTANCE * self.scale
+        for actor, blend in self.actors.items():
+            if actor.isEmpty(): continue
+            near = actor.getDistance(base.cam) < blendDistance
+            newBlend = self.frameBlend and near
+            if newBlend == blend: continue
+            actor.setBlend(frameBlend=newBlend)
+            self.actors[actor] = newBlend
+        return task.again
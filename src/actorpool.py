@@ -0,0 +1,39 @@
+"""A pool which keeps the player and enemy actors with their loaded models,
+animations and accessories alive between game sessions"""
+
+
+class ActorPool():
+    def __init__(self):
+        # lists of unused objects by their class
+        self.free = {}
+
+    def hasFree(self, cls):
+        """Check if an object of the given class can be reused without
+        having to load it again"""
+        return len(self.free.get(cls, [])) > 0
+
+    def acquire(self, cls):
+        """Return a reset object of the given class, a new one will only be
+        created if there is no unused one in the pool"""
+        free = self.free.get(cls, [])
+        if len(free) > 0:
+            return free.pop()
+        return cls()
+
+    def warm(self, cls):
+        """Create a new object of the given class and put it in the pool, so
+        it doesn't have to be created when it's needed"""
+        self.free.setdefault(cls, []).append(cls())
+
+    def release(self, obj):
+        """Give the object back to the pool, it will be reset and can be
+        acquired again by the next world"""
+        obj.reset()
+        self.free.setdefault(obj.__class__, []).append(obj)
+
+    def cleanup(self):
+        """Remove all pooled objects"""
+        for objects in self.free.values():
+            for obj in objects:
+                obj.cleanup()
+        self.free = {}
@@ -0,0 +1,212 @@
+"""Kinematic movement for the characters. Each simulation tick the capsule of
+a character is swept from its last to its new position with one query against
+the level collision, the contacts of that query resolve the ground, the walls
+and the ledges in front of the character together. If the level has a baked
+height field, the ground is looked up in it instead."""
+import math
+import collidelayers
+from panda3d.core import (
+    CollisionTraverser,
+    CollisionHandlerQueue,
+    CollisionNode,
+    CollisionSphere,
+    CollisionSegment,
+    Point3,
+    Vec3)
+
+
+class CharacterController():
+    # the highest step the character will walk up
+    STEPHEIGHT = 0.35
+    # the steepest slope in degrees the character can stand on
+    MAXSLOPE = 50.0
+    # the distance the character will be snapped down to the ground
+    GROUNDSNAP = 0.3
+    GRAVITY = 9.81
+    # the fastest the character will fall in units per second
+    MAXFALLSPEED = 5.0
+
+    def __init__(self, nodePath, radius, height, fromLayers, ledgeProbe=None, ledgeCallback=None):
+        """The capsule stands on the origin of the given node. The ledge probe
+        is a segment (start, end) relative to the node, the callback will be
+        called when the ground under the probe disappears while the
+        character is standing on the ground."""
+        self.nodePath = nodePath
+        self.radius = radius
+        self.height = height
+        self.minNormalZ = math.cos(math.radians(CharacterController.MAXSLOPE))
+        self.ledgeCallback = ledgeCallback
+        self.traverser = CollisionTraverser("characterController")
+        self.queue = CollisionHandlerQueue()
+        # the capsule as spheres stacked from the step height up to the top,
+        # anything lower than the step height is handled as ground
+        bottom = CharacterController.STEPHEIGHT + radius
+        top = max(bottom, height - radius)
+        numSpheres = int(math.ceil((top - bottom) / radius)) + 1
+        capsule = CollisionNode("characterCapsule")
+        for i in range(numSpheres):
+            z = bottom + (top - bottom) * i / max(1, numSpheres - 1)
+            capsule.addSolid(CollisionSphere(0, 0, z, radius))
+        self.capsule = self.__addCollider(capsule, fromLayers)
+        # the segment from the last to the new center, so thin walls can't be
+        # passed in one tick
+        self.sweepSegment = CollisionSegment(0, 0, 0, 0, 0, 0.001)
+        self.sweep = self.__addSegment("characterSweep", self.sweepSegment, fromLayers)
+        self.groundSegment = CollisionSegment(
+            0, 0, height * 0.5, 0, 0, -CharacterController.GROUNDSNAP)
+        self.ground = self.__addSegment("characterGround", self.groundSegment, ["floor"])
+        self.heightField = None
+        self.ledgeActive = ledgeProbe is not None
+        self.ledge = None
+        if ledgeProbe is not None:
+            self.ledge = self.__addSegment(
+                "characterLedge", CollisionSegment(ledgeProbe[0], ledgeProbe[1]), ["floor"])
+        self.reset()
+
+    def __addSegment(self, name, segment, fromLayers):
+        node = CollisionNode(name)
+        node.addSolid(segment)
+        return self.__addCollider(node, fromLayers)
+
+    def __addCollider(self, node, fromLayers):
+        colNP = self.nodePath.attachNewNode(node)
+        collidelayers.setCollider(colNP, fromLayers)
+        self.traverser.addCollider(colNP, self.queue)
+        return colNP
+
+    def setHeightField(self, heightField):
+        """Look the ground up in the given height field instead of probing
+        for it, None probes for it again"""
+        if heightField is not None and self.heightField is None:
+            self.traverser.removeCollider(self.ground)
+        elif heightField is None and self.heightField is not None:
+            self.traverser.addCollider(self.ground, self.queue)
+        self.heightField = heightField
+
+    def setLedgeProbeActive(self, active):
+        """Enable or disable the ledge probe, used if the ledges are looked
+        up somewhere else"""
+        if self.ledge is None or active == self.ledgeActive: return
+        if active:
+            self.traverser.addCollider(self.ledge, self.queue)
+        else:
+            self.traverser.removeCollider(self.ledge)
+            self.atLedge = False
+        self.ledgeActive = active
+
+    def __getGroundHeight(self, pos):
+        """Return the height of the walkable ground at the given position
+        from the height field or None if there is none"""
+        groundZ = self.heightField.getHeight(pos.getX(), pos.getY())
+        if groundZ is None: return None
+        if groundZ > pos.getZ() + CharacterController.STEPHEIGHT: return None
+        if groundZ < pos.getZ() - CharacterController.GROUNDSNAP: return None
+        return groundZ
+
+    def reset(self):
+        """Forget the movement and ground state, used after the character has
+        been placed somewhere else"""
+        self.motion = Vec3(0, 0, 0)
+        self.fallSpeed = 0.0
+        self.onGround = True
+        self.atLedge = False
+
+    def move(self, motion):
+        """Add a motion in render space the character should do this tick"""
+        self.motion += Vec3(motion.getX(), motion.getY(), 0)
+
+    def update(self, dt):
+        """Move the character by the motion of this tick and gravity and
+        resolve all contacts of the one collision query"""
+        oldPos = self.nodePath.getPos(render)
+        if not self.onGround:
+            self.fallSpeed = min(
+                self.fallSpeed + CharacterController.GRAVITY * dt,
+                CharacterController.MAXFALLSPEED)
+        newPos = oldPos + self.motion - Vec3(0, 0, self.fallSpeed * dt)
+        self.motion = Vec3(0, 0, 0)
+        self.nodePath.setPos(render, newPos)
+        center = Vec3(0, 0, self.height * 0.5)
+        start = self.nodePath.getRelativePoint(render, oldPos + center)
+        end = Point3(center)
+        if (end - start).lengthSquared() < 0.000001:
+            start = end + Vec3(0, 0, 0.001)
+        segment = self.sweep.node().modifySolid(0)
+        segment.setPointA(start)
+        segment.setPointB(end)
+
+        self.queue.clearEntries()
+        self.traverser.traverse(render)
+
+        groundZ = None
+        floorAhead = False
+        sweepHit = None
+        contacts = []
+        for i in range(self.queue.getNumEntries()):
+            entry = self.queue.getEntry(i)
+            fromNP = entry.getFromNodePath()
+            normal = entry.getSurfaceNormal(render)
+            walkable = normal.getZ() >= self.minNormalZ
+            point = entry.getSurfacePoint(render)
+            if fromNP == self.ground:
+                if walkable and point.getZ() <= newPos.getZ() + CharacterController.STEPHEIGHT:
+                    if groundZ is None or point.getZ() > groundZ:
+                        groundZ = point.getZ()
+            elif self.ledge is not None and fromNP == self.ledge:
+                if walkable:
+                    floorAhead = True
+            elif walkable:
+                # the ground never pushes sideways, so slopes don't jitter
+                continue
+            elif fromNP == self.sweep:
+                distance = (point - (oldPos + center)).length()
+                if sweepHit is None or distance < sweepHit:
+                    sweepHit = distance
+            else:
+                contacts.append((point - entry.getInteriorPoint(render), normal))
+
+        if sweepHit is not None:
+            # a wall has been passed, stop in front of it
+            move = Vec3(newPos.getX() - oldPos.getX(), newPos.getY() - oldPos.getY(), 0)
+            length = move.length()
+            if length > 0:
+                move *= max(0.0, sweepHit - self.radius) / length
+            newPos = Point3(oldPos.getX() + move.getX(), oldPos.getY() + move.getY(), newPos.getZ())
+        else:
+            newPos += self.__getPush(contacts)
+        if self.heightField is not None:
+            groundZ = self.__getGroundHeight(newPos)
+
+        if groundZ is not None:
+            newPos.setZ(groundZ)
+            self.fallSpeed = 0.0
+            self.onGround = True
+        else:
+            self.onGround = False
+        self.nodePath.setPos(render, newPos)
+
+        if self.ledgeActive:
+            atLedge = self.onGround and not floorAhead
+            if atLedge and not self.atLedge and self.ledgeCallback is not None:
+                self.ledgeCallback()
+            self.atLedge = atLedge
+
+    def __getPush(self, contacts):
+        """Return the horizontal push out of all wall contacts, contacts with
+        the same wall don't add up"""
+        push = Vec3(0, 0, 0)
+        contacts.sort(key=lambda contact: -contact[0].lengthSquared())
+        for depth, normal in contacts:
+            normal = Vec3(normal.getX(), normal.getY(), 0)
+            if normal.lengthSquared() < 0.000001: continue
+            normal.normalize()
+            remaining = depth.dot(normal) - push.dot(normal)
+            if remaining > 0:
+                push += normal * remaining
+        return push
+
+    def cleanup(self):
+        self.traverser.clearColliders()
+        for colNP in (self.capsule, self.sweep, self.ground, self.ledge):
+            if colNP is not None:
+                colNP.removeNode()
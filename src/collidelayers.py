@@ -0,0 +1,59 @@
+"""The collide mask layers all collision solids of the game are sorted into.
+Colliders only get the layers they are interested in as from mask, so the
+traverser will skip every other pair instead of the handlers filtering the
+entries by the names of the nodes."""
+import re
+from panda3d.core import (
+    BitMask32,
+    GeomNode)
+
+# the bit of each layer, the visible geometry of the level gets an empty
+# into mask and the actors keep the default geom bit 20 no collider tests
+LAYERS = {
+    "floor": 0,
+    "wall": 1,
+    "trigger": 2,
+    "enemyHitbox": 3,
+    "playerHitbox": 4}
+
+# the layer of the collision nodes in the level models by their name, all
+# other collision nodes are walls
+LEVELLAYERS = [
+    (re.compile(r"^(Floor|Plate)"), "floor"),
+    (re.compile(r"^Deathplane"), "trigger")]
+
+
+def getMask(*layers):
+    """Return the mask containing all the given layers"""
+    mask = BitMask32.allOff()
+    for layer in layers:
+        mask.setBit(LAYERS[layer])
+    return mask
+
+
+def setCollider(nodePath, fromLayers, intoLayers=[]):
+    """Set which layers the collision node tests against and which layers
+    it can be hit as, colliders which can't be hit get an empty into mask"""
+    nodePath.node().setFromCollideMask(getMask(*fromLayers))
+    nodePath.node().setIntoCollideMask(getMask(*intoLayers))
+
+
+def setSolid(nodePath, *layers):
+    """Set the layers a collision node which is never a collider belongs to"""
+    nodePath.node().setFromCollideMask(BitMask32.allOff())
+    nodePath.node().setIntoCollideMask(getMask(*layers))
+
+
+def getLevelLayer(name):
+    for pattern, layer in LEVELLAYERS:
+        if pattern.match(name):
+            return layer
+    return "wall"
+
+
+def applyLevelLayers(model):
+    """Sort all collision nodes of a level or prop model into their layers,
+    the visible geometry will not be collided with at all"""
+    model.setCollideMask(BitMask32.allOff(), BitMask32.allOn(), GeomNode.getClassType())
+    for colNP in model.findAllMatches("**/+CollisionNode"):
+        setSolid(colNP, getLevelLayer(colNP.getName()))
@@ -0,0 +1,45 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""Build step to cook the game assets into their fast loading runtime
+formats. Only files whose sources have changed will be rebuilt.
+
+usage: python cook.py [--archive] [output directory]
+
+    --archive  pack the assets and cooked files into the multifile archives
+               which will be mounted by the game instead of the assets folder
+"""
+import os
+import sys
+import time
+import logging
+from cooking.bamcooker import cookModels
+from cooking.texturecooker import cookTextures
+from cooking.archive import packAssets
+
+rootdir = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+assetDir = os.path.join(rootdir, "assets")
+
+
+def main(argv):
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(levelname)s: %(message)s")
+    args = [arg for arg in argv[1:] if not arg.startswith("--")]
+    if len(args) > 0:
+        outDir = os.path.abspath(args[0])
+    else:
+        outDir = os.path.join(os.path.expanduser("~"), "Ajaw", "cooked")
+
+    start = time.time()
+    numTextures, textures = cookTextures(assetDir, outDir)
+    logging.info("cooked %d textures in %0.2fs" % (numTextures, time.time() - start))
+    start = time.time()
+    numModels = cookModels(assetDir, outDir, textures)
+    logging.info("cooked %d models in %0.2fs" % (numModels, time.time() - start))
+    if "--archive" in argv:
+        start = time.time()
+        numArchives = packAssets(assetDir, outDir, rootdir)
+        logging.info("packed %d archives in %0.2fs" % (numArchives, time.time() - start))
+
+if __name__ == "__main__":
+    main(sys.argv)
@@ -0,0 +1,90 @@
+"""Pack the assets and cooked files into indexed multifile archives, so the
+game only has to open a few files instead of one per asset"""
+import os
+import logging
+from panda3d.core import (
+    Filename,
+    Multifile)
+from cooking.manifest import Manifest
+from cooking.texturecooker import TIERS, getTierDir
+
+ARCHIVENAME = "assets.mf"
+
+
+def getTextureArchiveName(tier):
+    return "textures-%s.mf" % tier
+
+
+def collectFiles(directory, skipExtensions=[], skipDirs=[]):
+    """Return a list of (subfile name, path) tuples for all files within the
+    given directory"""
+    files = []
+    for root, dirs, fns in os.walk(directory):
+        dirs[:] = [d for d in dirs if os.path.join(root, d) not in skipDirs]
+        for fn in fns:
+            if os.path.splitext(fn)[1] in skipExtensions: continue
+            path = os.path.join(root, fn)
+            name = os.path.relpath(path, directory).replace(os.sep, "/")
+            files.append((name, path))
+    return files
+
+
+def packArchive(archivePath, files, manifest):
+    """Write all files into the archive if any of them has changed since the
+    archive has been packed the last time. The subfiles are stored without
+    compression, so they can be read straight from the archive with one
+    seek each. Returns True if the archive has been written."""
+    files = sorted(files)
+    key = os.path.basename(archivePath)
+    sources = [path for name, path in files]
+    names = ",".join([name for name, path in files])
+    if not manifest.isStale(key, archivePath, sources, names):
+        return False
+    logging.info("pack %s with %d files" % (key, len(files)))
+    if os.path.exists(archivePath):
+        os.remove(archivePath)
+    mf = Multifile()
+    if not mf.openWrite(Filename.fromOsSpecific(archivePath)):
+        logging.error("could not open %s for writing" % archivePath)
+        return False
+    mf.setRecordTimestamp(False)
+    for name, path in files:
+        mf.addSubfile(name, Filename.fromOsSpecific(path), 0)
+    mf.flush()
+    mf.close()
+    manifest.update(key, archivePath, sources, names)
+    return True
+
+
+def packAssets(assetDir, cookDir, outDir):
+    """Pack the loose assets together with the cooked models into one archive
+    and the cooked textures into one archive per quality tier. Eggs which have
+    been cooked to bam files are left out. Returns the number of archives
+    which have been written."""
+    manifest = Manifest(os.path.join(cookDir, "archives.json"))
+    cookedFiles = collectFiles(
+        cookDir,
+        [".json", ".mf"],
+        [os.path.join(cookDir, "textures")])
+    cookedNames = set([name for name, path in cookedFiles])
+    assetFiles = []
+    for name, path in collectFiles(assetDir):
+        if name.endswith(".egg") and name[:-len(".egg")] + ".bam" in cookedNames:
+            continue
+        assetFiles.append((name, path))
+    packed = 0
+    if packArchive(
+            os.path.join(outDir, ARCHIVENAME),
+            assetFiles + cookedFiles,
+            manifest):
+        packed += 1
+    for tier in TIERS.keys():
+        tierDir = getTierDir(cookDir, tier)
+        if not os.path.exists(tierDir): continue
+        if packArchive(
+                os.path.join(outDir, getTextureArchiveName(tier)),
+                collectFiles(tierDir),
+                manifest):
+            packed += 1
+    manifest.save()
+    return packed
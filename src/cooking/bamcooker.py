@@ -0,0 +1,142 @@
+"""Convert the text .egg models and animations of the assets folder to
+binary .bam files which are a lot faster to load"""
+import os
+import re
+import inspect
+import logging
+from panda3d.core import (
+    Filename,
+    NodePath,
+    TexturePool,
+    loadPrcFileData)
+from panda3d.egg import loadEggFile
+from cooking.manifest import Manifest
+from cooking.levelcooker import cookLevel
+from cooking.lodcooker import ACTORS, LODLEVELS, getLODName, makeLODModel
+
+# external references like <File> { Spikes } within egg files
+FILEREF = re.compile(r"<File>\s*\{\s*\"?([^\s\"}]+)\"?\s*\}")
+# functions which restructure specific models before they get written, by
+# the egg file path relative to the asset folder
+PROCESSORS = {
+    "Level.egg": cookLevel}
+
+
+def findEggDependencies(eggPath, assetDir):
+    """Return the egg file itself and all egg files it references, as
+    changes to one of those have to rebuild the cooked file too"""
+    deps = [eggPath]
+    pending = [eggPath]
+    while pending:
+        with open(pending.pop(), "r") as f:
+            content = f.read()
+        for ref in FILEREF.findall(content):
+            if not ref.endswith(".egg"):
+                ref += ".egg"
+            refPath = os.path.join(assetDir, ref)
+            if os.path.exists(refPath) and refPath not in deps:
+                deps.append(refPath)
+                pending.append(refPath)
+    return deps
+
+
+def redirectTextures(model, textures):
+    """Let all textures of the model which are in the given list of texture
+    basenames point to their cooked txo files instead"""
+    for tex in model.findAllTextures():
+        fn = tex.getFilename()
+        if fn.getBasename() not in textures: continue
+        txo = Filename(fn.getBasenameWoExtension() + ".txo")
+        tex.setFilename(txo)
+        tex.setFullpath(txo)
+
+
+def cookEgg(eggPath, bamPath, textures=[], processor=None):
+    """Load the given egg file and write it out as bam file, the optional
+    processor function gets the loaded model before it is written"""
+    node = loadEggFile(Filename.fromOsSpecific(eggPath))
+    if node is None:
+        logging.error("could not load %s for cooking" % eggPath)
+        return False
+    model = NodePath(node)
+    if textures:
+        redirectTextures(model, textures)
+    if processor is not None:
+        model = processor(model)
+    return model.writeBamFile(Filename.fromOsSpecific(bamPath))
+
+
+def cookLODModel(eggPath, bamPath, fraction, textures=[]):
+    """Write a reduced version of the given egg file as bam file"""
+    model = makeLODModel(eggPath, fraction)
+    if model is None:
+        return False
+    if textures:
+        redirectTextures(model, textures)
+    return model.writeBamFile(Filename.fromOsSpecific(bamPath))
+
+
+def cookModels(assetDir, outDir, textures=[]):
+    """Cook all egg files found in assetDir to bam files in outDir. Only
+    files which are new or whose sources have changed since the last run
+    will be rebuilt. The textures list contains the basenames of textures
+    which have been cooked to txo files, the bam files will reference those
+    instead of the original images. Returns the number of cooked files."""
+    if not os.path.exists(outDir):
+        os.makedirs(outDir)
+    # store only the texture basenames in the bam files, so the textures will
+    # be found through the model path just like the ones referenced by eggs
+    loadPrcFileData("", "bam-texture-mode basename")
+    manifest = Manifest(os.path.join(outDir, "models.json"))
+    options = ",".join(sorted(textures))
+    cooked = 0
+    keys = []
+    for root, dirs, files in os.walk(assetDir):
+        for fn in sorted(files):
+            if not fn.endswith(".egg"): continue
+            eggPath = os.path.join(root, fn)
+            key = os.path.relpath(eggPath, assetDir)
+            keys.append(key)
+            bamPath = os.path.join(outDir, key[:-len(".egg")] + ".bam")
+            deps = findEggDependencies(eggPath, assetDir)
+            processor = PROCESSORS.get(key.replace(os.sep, "/"))
+            keyOptions = options
+            if processor is not None:
+                # changing the processor has to rebuild the file too
+                keyOptions += ";" + processor.__name__
+                source = inspect.getsourcefile(processor)
+                if source is not None:
+                    deps.append(os.path.abspath(source))
+            if not manifest.isStale(key, bamPath, deps, keyOptions): continue
+            if not os.path.exists(os.path.dirname(bamPath)):
+                os.makedirs(os.path.dirname(bamPath))
+            logging.info("cook %s" % key)
+            if cookEgg(eggPath, bamPath, textures, processor):
+                manifest.update(key, bamPath, deps, keyOptions)
+                cooked += 1
+    # generate the reduced meshes of the actors
+    for actor in ACTORS:
+        eggPath = os.path.join(assetDir, actor)
+        if not os.path.exists(eggPath): continue
+        deps = findEggDependencies(eggPath, assetDir)
+        for level, fraction in LODLEVELS:
+            key = getLODName(actor[:-len(".egg")], level) + ".bam"
+            keys.append(key)
+            bamPath = os.path.join(outDir, key)
+            lodOptions = "%s;%f" % (options, fraction)
+            if not manifest.isStale(key, bamPath, deps, lodOptions): continue
+            logging.info("cook %s" % key)
+            if cookLODModel(eggPath, bamPath, fraction, textures):
+                manifest.update(key, bamPath, deps, lodOptions)
+                cooked += 1
+    # remove cooked files whose source eggs don't exist anymore
+    for output in manifest.prune(keys):
+        path = os.path.join(outDir, output)
+        if os.path.exists(path):
+            os.remove(path)
+    manifest.save()
+    if cooked > 0:
+        # the cooking process has loaded all the textures which are not
+        # needed anymore and got renamed to the txo files
+        TexturePool.releaseAllTextures()
+    return cooked
@@ -0,0 +1,321 @@
+"""Restructure the level model for fast rendering. All static geometry will be
+collected by the prop model it has been placed from, split into the rooms of
+the level and flattened into one batch per model, render state and room,
+while the dynamic objects driven by the level
+logic and all the named nodes the level looks up stay untouched and
+addressable. The static collision solids are sorted into a bounding volume
+hierarchy, the heights of the floor are baked into a height field and the
+ledges the player can jump off into a ledge graph."""
+import re
+import fnmatch
+import math
+import bisect
+import logging
+from array import array
+import collidelayers
+from level.heightfield import HeightField, NOFLOOR
+from level.ledgegraph import LedgeGraph, DIRECTIONS
+from panda3d.core import (
+    NodePath,
+    PandaNode,
+    GeomNode,
+    CollisionNode,
+    CollisionPolygon,
+    Geom,
+    GeomVertexReader)
+
+# top level groups which will be animated, lit separately or are used as
+# spawn points by the level logic, they won't be touched
+DYNAMIC = [
+    "Switch*",
+    "Boulder_Door*",
+    "Wooden_Door_Basic*",
+    "Box_long_looseLid*",
+    "Signpost*",
+    "Plate*",
+    "Heart*",
+    "Character",
+    "Golem",
+    "Deathplane"]
+# nodes within the static groups which are looked up by the level logic to
+# place lights and effects, empty copies of them will be kept in the level
+MARKERS = [
+    "TorchTop*",
+    "Window*"]
+# the number suffix of repeatedly placed props, like Spikes.123
+PLACEMENTSUFFIX = re.compile(r"\.\d+$")
+# the doors separating the rooms, the level runs along the Y axis, so every
+# door splits it at its Y position
+DOORS = [
+    "Boulder_Door*",
+    "Wooden_Door_Basic*"]
+# the most solids in one collision node of the collision hierarchy
+LEAFSIZE = 8
+# the size of the cells of the floor height field
+HEIGHTCELLSIZE = 0.25
+# the floor has to drop more than this next to a cell to make it a ledge
+LEDGEDROP = 2.0
+# the distance a jump off a ledge goes
+JUMPDISTANCE = 3.2
+
+
+def matches(name, patterns):
+    for pattern in patterns:
+        if fnmatch.fnmatchcase(name, pattern):
+            return True
+    return False
+
+
+def extractMarkers(nodePath, parent):
+    """Create empty copies of all marker nodes below nodePath and their
+    ancestors under the given parent, keeping names and transforms. Returns
+    the number of marker nodes found."""
+    found = 0
+    copy = NodePath(PandaNode(nodePath.getName()))
+    copy.setTransform(nodePath.getTransform())
+    for child in nodePath.getChildren():
+        found += extractMarkers(child, copy)
+    if matches(nodePath.getName(), MARKERS):
+        found += 1
+    if found > 0:
+        copy.reparentTo(parent)
+    return found
+
+
+def getCellIndex(y, boundaries):
+    return bisect.bisect_left(boundaries, y)
+
+
+def getPropName(nodePath):
+    """Return the name of the prop model the group has been placed from"""
+    return PLACEMENTSUFFIX.sub("", nodePath.getName())
+
+
+def splitGeomNode(nodePath, boundaries, cells, propName):
+    """Distribute the primitives of the GeomNode to the prop batch nodes
+    within the given cell nodes by the Y position of their center. The new
+    geoms share the vertex data of the original ones."""
+    geomNode = nodePath.node()
+    mat = nodePath.getMat(cells[0].getParent())
+    for i in range(geomNode.getNumGeoms()):
+        geom = geomNode.getGeom(i)
+        state = geomNode.getGeomState(i)
+        reader = GeomVertexReader(geom.getVertexData(), "vertex")
+        cellPrims = {}
+        for j in range(geom.getNumPrimitives()):
+            prim = geom.getPrimitive(j).decompose()
+            for k in range(prim.getNumPrimitives()):
+                start = prim.getPrimitiveStart(k)
+                end = prim.getPrimitiveEnd(k)
+                y = 0.0
+                for v in range(start, end):
+                    reader.setRow(prim.getVertex(v))
+                    y += mat.xformPoint(reader.getData3f()).getY()
+                cell = getCellIndex(y / max(1, end - start), boundaries)
+                if cell not in cellPrims:
+                    cellPrims[cell] = prim.makeCopy()
+                    cellPrims[cell].clearVertices()
+                cellPrim = cellPrims[cell]
+                for v in range(start, end):
+                    cellPrim.addVertex(prim.getVertex(v))
+                cellPrim.closePrimitive()
+        for cell, cellPrim in cellPrims.items():
+            cellGeom = Geom(geom.getVertexData())
+            cellGeom.addPrimitive(cellPrim)
+            cellNode = GeomNode(geomNode.getName())
+            cellNode.addGeom(cellGeom, state)
+            batch = cells[cell].find(propName)
+            if batch.isEmpty():
+                batch = cells[cell].attachNewNode(PandaNode(propName))
+            cellNP = batch.attachNewNode(cellNode)
+            cellNP.setMat(mat)
+            cellNP.setState(nodePath.getNetState())
+    nodePath.removeNode()
+
+
+def buildHierarchy(name, solids, parent):
+    """Split the solids in halves along the axis they are spread the most
+    until each half fits into one collision node, so the traverser can skip
+    whole branches by their bounds. Returns the number of leaf nodes."""
+    if len(solids) <= LEAFSIZE:
+        node = CollisionNode(name)
+        for solid in solids:
+            node.addSolid(solid)
+        parent.attachNewNode(node)
+        return 1
+    origins = [solid.getCollisionOrigin() for solid in solids]
+    extents = [
+        max(origin[axis] for origin in origins) - min(origin[axis] for origin in origins)
+        for axis in range(3)]
+    axis = extents.index(max(extents))
+    order = sorted(range(len(solids)), key=lambda i: origins[i][axis])
+    half = len(order) / 2
+    branch = parent.attachNewNode(PandaNode(name))
+    leaves = buildHierarchy(name, [solids[i] for i in order[:half]], branch)
+    leaves += buildHierarchy(name, [solids[i] for i in order[half:]], branch)
+    return leaves
+
+
+def buildCollision(collision):
+    """Replace the collision nodes below collision by one bounding volume
+    hierarchy per node name, the leaves keep the name so the collide mask
+    layers can still be chosen by it"""
+    # bring all solids into the space of the collision root
+    collision.flattenLight()
+    solids = {}
+    for colNP in collision.findAllMatches("**/+CollisionNode"):
+        name = getPropName(colNP)
+        for i in range(colNP.node().getNumSolids()):
+            solids.setdefault(name, []).append(colNP.node().getSolid(i))
+    collision.getChildren().detach()
+    for name, nameSolids in solids.items():
+        leaves = buildHierarchy(name, nameSolids, collision)
+        logging.info("collision hierarchy of %s with %d solids in %d leaves" % (
+            name, len(nameSolids), leaves))
+
+
+def getFloorTriangles(model):
+    """Return the triangles of all floor collision polygons in model space"""
+    triangles = []
+    for colNP in model.findAllMatches("**/+CollisionNode"):
+        if collidelayers.getLevelLayer(colNP.getName()) != "floor": continue
+        mat = colNP.getMat(model)
+        for i in range(colNP.node().getNumSolids()):
+            solid = colNP.node().getSolid(i)
+            if not isinstance(solid, CollisionPolygon): continue
+            points = [mat.xformPoint(solid.getPoint(j)) for j in range(solid.getNumPoints())]
+            for j in range(1, len(points) - 1):
+                triangles.append((points[0], points[j], points[j + 1]))
+    return triangles
+
+
+def bakeHeightField(model):
+    """Rasterize the floor into a grid which holds the height of the highest
+    floor at the center of each cell"""
+    triangles = getFloorTriangles(model)
+    if not triangles:
+        logging.warning("no floor found to bake a height field from")
+        return None
+    cell = HEIGHTCELLSIZE
+    minX = min(p.getX() for triangle in triangles for p in triangle)
+    minY = min(p.getY() for triangle in triangles for p in triangle)
+    maxX = max(p.getX() for triangle in triangles for p in triangle)
+    maxY = max(p.getY() for triangle in triangles for p in triangle)
+    columns = int(math.ceil((maxX - minX) / cell)) + 1
+    rows = int(math.ceil((maxY - minY) / cell)) + 1
+    heights = array("f", [NOFLOOR]) * (columns * rows)
+    for a, b, c in triangles:
+        d = (b.getY() - c.getY()) * (a.getX() - c.getX()) + (c.getX() - b.getX()) * (a.getY() - c.getY())
+        # skip triangles which are vertical when seen from above
+        if abs(d) < 0.000001: continue
+        c1 = int(math.floor((min(a.getX(), b.getX(), c.getX()) - minX) / cell))
+        c2 = int(math.ceil((max(a.getX(), b.getX(), c.getX()) - minX) / cell))
+        r1 = int(math.floor((min(a.getY(), b.getY(), c.getY()) - minY) / cell))
+        r2 = int(math.ceil((max(a.getY(), b.getY(), c.getY()) - minY) / cell))
+        for row in range(max(0, r1), min(rows, r2 + 1)):
+            y = minY + (row + 0.5) * cell
+            for column in range(max(0, c1), min(columns, c2 + 1)):
+                x = minX + (column + 0.5) * cell
+                # the barycentric coordinates of the cell center
+                l1 = ((b.getY() - c.getY()) * (x - c.getX()) + (c.getX() - b.getX()) * (y - c.getY())) / d
+                l2 = ((c.getY() - a.getY()) * (x - c.getX()) + (a.getX() - c.getX()) * (y - c.getY())) / d
+                l3 = 1.0 - l1 - l2
+                if l1 < -0.001 or l2 < -0.001 or l3 < -0.001: continue
+                z = l1 * a.getZ() + l2 * b.getZ() + l3 * c.getZ()
+                index = row * columns + column
+                if z > heights[index]:
+                    heights[index] = z
+    logging.info("baked height field with %dx%d cells from %d triangles" % (
+        columns, rows, len(triangles)))
+    return HeightField(minX, minY, cell, columns, rows, heights)
+
+
+def bakeLedgeGraph(heightField):
+    """Find all floor cells next to a drop and the landing point of a jump
+    off them in each direction the floor drops away in"""
+    cells = array("i")
+    directions = array("b")
+    landings = array("f")
+    heights = heightField.heights
+    columns = heightField.columns
+    rows = heightField.rows
+    cell = heightField.cellSize
+    for row in range(rows):
+        for column in range(columns):
+            height = heights[row * columns + column]
+            if height <= NOFLOOR: continue
+            x = heightField.minX + (column + 0.5) * cell
+            y = heightField.minY + (row + 0.5) * cell
+            for direction, (dx, dy) in enumerate(DIRECTIONS):
+                nextColumn = column + dx
+                nextRow = row + dy
+                nextHeight = NOFLOOR
+                if 0 <= nextColumn < columns and 0 <= nextRow < rows:
+                    nextHeight = heights[nextRow * columns + nextColumn]
+                if nextHeight >= height - LEDGEDROP: continue
+                length = math.hypot(dx, dy)
+                landingX = x + dx / length * JUMPDISTANCE
+                landingY = y + dy / length * JUMPDISTANCE
+                # land on the floor if there is one, otherwise the jump ends
+                # in the air slightly above the ledge like the original jump
+                landingZ = heightField.getHeight(landingX, landingY)
+                if landingZ is None or landingZ > height + 0.1:
+                    landingZ = height + 0.1
+                cells.append(row * columns + column)
+                directions.append(direction)
+                landings.extend([landingX, landingY, landingZ])
+    logging.info("baked %d ledges" % len(cells))
+    return LedgeGraph(heightField, cells, directions, landings)
+
+
+def cookLevel(model):
+    """Split the level model into its static and dynamic parts and flatten the
+    static geometry into one node per room, named cell.<index> and tagged
+    with the Y range of the room. The placements are grouped by their prop
+    model before they are split into the cells, each cell is flattened as a
+    whole, so all props of a room that share a render state end up in one
+    geom. Collision nodes are kept separately with their names, as their
+    collide mask layers are chosen by name when the level is loaded."""
+    static = NodePath(PandaNode("static"))
+    collision = NodePath(PandaNode("staticCollision"))
+    markers = NodePath(PandaNode("markers"))
+    props = {}
+    for child in model.getChildren():
+        if matches(child.getName(), DYNAMIC): continue
+        extractMarkers(child, markers)
+        propName = getPropName(child)
+        if propName not in props:
+            props[propName] = static.attachNewNode(PandaNode(propName))
+        child.reparentTo(props[propName])
+    for colNode in static.findAllMatches("**/+CollisionNode"):
+        colNode.wrtReparentTo(collision)
+    for prop in props.values():
+        logging.info("batch %d placements of %s" % (
+            prop.getNumChildren(), prop.getName()))
+        prop.clearModelNodes()
+        prop.flattenStrong()
+    boundaries = sorted([
+        door.getY(model) for door in model.getChildren()
+        if matches(door.getName(), DOORS)])
+    cells = []
+    for i in range(len(boundaries) + 1):
+        cell = static.attachNewNode(PandaNode("cell.%d" % i))
+        cell.setTag("minY", str(boundaries[i - 1]) if i > 0 else "-inf")
+        cell.setTag("maxY", str(boundaries[i]) if i < len(boundaries) else "inf")
+        cells.append(cell)
+    for propName, prop in props.items():
+        for geomNP in prop.findAllMatches("**/+GeomNode"):
+            splitGeomNode(geomNP, boundaries, cells, propName)
+        prop.removeNode()
+    for cell in cells:
+        # merge the batches of different props with the same render state
+        cell.flattenStrong()
+    static.reparentTo(model)
+    buildCollision(collision)
+    collision.reparentTo(model)
+    markers.reparentTo(model)
+    heightField = bakeHeightField(model)
+    if heightField is not None:
+        model.attachNewNode(heightField.makeNode())
+        model.attachNewNode(bakeLedgeGraph(heightField).makeNode())
+    return model
@@ -0,0 +1,107 @@
+"""Generate reduced meshes of the actor models for their lower levels of
+detail. The vertices of the model are clustered on a grid and every vertex
+is replaced by the first vertex of its cluster, so the reduced mesh keeps
+the joint memberships and the animations of the original model."""
+import math
+import logging
+from panda3d.core import (
+    Filename,
+    NodePath)
+from panda3d.egg import (
+    EggData,
+    EggGroupNode,
+    EggPolygon,
+    loadEggData)
+
+# the generated levels of detail with the grid size relative to the size of
+# the model, they will be written as <model>-<level>.bam
+LODLEVELS = [
+    ("medium", 0.02),
+    ("low", 0.05)]
+# the models which get reduced meshes
+ACTORS = [
+    "Character.egg",
+    "Golem.egg"]
+
+
+def getLODName(modelName, level):
+    return "%s-%s" % (modelName, level)
+
+
+def collectPolygons(group, polygons):
+    child = group.getFirstChild()
+    while child is not None:
+        if isinstance(child, EggPolygon):
+            polygons.append(child)
+        elif isinstance(child, EggGroupNode):
+            collectPolygons(child, polygons)
+        child = group.getNextChild()
+    return polygons
+
+
+def getGridSize(polygons, fraction):
+    """Return the grid size for the given fraction of the diagonal of the
+    bounding box of all polygons"""
+    minPos = None
+    maxPos = None
+    for polygon in polygons:
+        for i in range(polygon.getNumVertices()):
+            pos = polygon.getVertex(i).getPos3()
+            if minPos is None:
+                minPos = list(pos)
+                maxPos = list(pos)
+                continue
+            for axis in range(3):
+                minPos[axis] = min(minPos[axis], pos[axis])
+                maxPos[axis] = max(maxPos[axis], pos[axis])
+    if minPos is None: return 0.0
+    diagonal = math.sqrt(sum([(maxPos[i] - minPos[i]) ** 2 for i in range(3)]))
+    return diagonal * fraction
+
+
+def reduceMesh(egg, fraction):
+    """Cluster the vertices of all polygons and remove the polygons which
+    collapse. Returns the number of removed polygons."""
+    polygons = collectPolygons(egg, [])
+    gridSize = getGridSize(polygons, fraction)
+    if gridSize <= 0.0: return 0
+    clusters = {}
+    removed = 0
+    for polygon in polygons:
+        vertices = []
+        for i in range(polygon.getNumVertices()):
+            vertex = polygon.getVertex(i)
+            pos = vertex.getPos3()
+            key = (
+                vertex.getPool().getName(),
+                int(math.floor(pos[0] / gridSize)),
+                int(math.floor(pos[1] / gridSize)),
+                int(math.floor(pos[2] / gridSize)))
+            cluster = clusters.setdefault(key, vertex)
+            if cluster not in vertices:
+                vertices.append(cluster)
+        if len(vertices) < 3:
+            polygon.getParent().removeChild(polygon)
+            removed += 1
+            continue
+        polygon.clear()
+        for vertex in vertices:
+            polygon.addVertex(vertex)
+    egg.removeUnusedVertices(True)
+    return removed
+
+
+def makeLODModel(eggPath, fraction):
+    """Load the egg file with a reduced mesh, returns the model NodePath or
+    None if the file couldn't be read"""
+    egg = EggData()
+    if not egg.read(Filename.fromOsSpecific(eggPath)):
+        logging.error("could not read %s for reducing" % eggPath)
+        return None
+    numPolygons = len(collectPolygons(egg, []))
+    removed = reduceMesh(egg, fraction)
+    logging.info("reduced %s from %d to %d polygons" % (
+        eggPath, numPolygons, numPolygons - removed))
+    node = loadEggData(egg)
+    if node is None: return None
+    return NodePath(node)
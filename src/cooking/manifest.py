@@ -0,0 +1,87 @@
+"""Content hash manifest used by the asset cookers to find out which cooked
+files are out of date and have to be rebuilt"""
+import os
+import json
+import hashlib
+import logging
+
+
+def hashFile(path):
+    """Return the sha1 hex digest of the content of the given file"""
+    sha = hashlib.sha1()
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(65536)
+            if not chunk: break
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+class Manifest():
+    # increase this whenever the layout of the cooked files changes, so
+    # old caches will be rebuilt completely
+    VERSION = 1
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        # cache of already calculated file hashes for this run
+        self.hashes = {}
+        self.load()
+
+    def load(self):
+        if not os.path.exists(self.path): return
+        try:
+            with open(self.path, "r") as f:
+                data = json.load(f)
+        except (IOError, ValueError):
+            logging.warning("cook manifest %s is broken, rebuild all" % self.path)
+            return
+        if data.get("version") != Manifest.VERSION: return
+        self.entries = data.get("entries", {})
+
+    def save(self):
+        directory = os.path.dirname(self.path)
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        with open(self.path, "w") as f:
+            json.dump(
+                {"version":Manifest.VERSION, "entries":self.entries},
+                f,
+                indent=1,
+                sort_keys=True)
+
+    def getHash(self, sources, options=""):
+        """Calculate one hash over the content of all the given source files
+        and the cook options used to build the output"""
+        sha = hashlib.sha1(options)
+        for source in sources:
+            if source not in self.hashes:
+                self.hashes[source] = hashFile(source)
+            sha.update(self.hashes[source])
+        return sha.hexdigest()
+
+    def isStale(self, key, output, sources, options=""):
+        """Check if the cooked file output for the given key has to be rebuilt
+        because it's missing or one of its sources has changed"""
+        entry = self.entries.get(key)
+        if entry is None: return True
+        if not os.path.exists(output): return True
+        return entry.get("hash") != self.getHash(sources, options)
+
+    def update(self, key, output, sources, options=""):
+        """Store the current hash of the sources for the given key"""
+        self.entries[key] = {
+            "hash":self.getHash(sources, options),
+            "output":os.path.relpath(output, os.path.dirname(self.path)),
+            "size":os.path.getsize(output)}
+
+    def prune(self, keys):
+        """Remove all entries which are not in the given list of keys and
+        return the output filenames of the removed entries"""
+        removed = []
+        for key in self.entries.keys():
+            if key not in keys:
+                removed.append(self.entries[key]["output"])
+                del self.entries[key]
+        return removed
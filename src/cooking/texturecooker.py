@@ -0,0 +1,109 @@
+"""Cook the textures used by the models to .txo files which contain the
+already generated mipmaps and can be loaded without decoding the png files.
+Every texture is written in different quality tiers, which are downscaled
+versions of the original image for slower machines."""
+import os
+import re
+import logging
+from panda3d.core import (
+    Filename,
+    PNMImage,
+    Texture)
+from cooking.manifest import Manifest
+
+# the tiers and the factor the texture size will be divided by
+TIERS = {
+    "full":1,
+    "half":2,
+    "quarter":4}
+DEFAULTTIER = "full"
+# textures will never be scaled below this size
+MINSIZE = 16
+
+# texture file references within egg files like "./Walls.png"
+TEXTUREREF = re.compile(r"<Texture>\s*\S+\s*\{\s*\"([^\"]+)\"")
+
+
+def getTierDir(outDir, tier):
+    return os.path.join(outDir, "textures", tier)
+
+
+def findModelTextures(assetDir):
+    """Return the basenames of all textures referenced by the egg files"""
+    textures = set()
+    for root, dirs, files in os.walk(assetDir):
+        for fn in files:
+            if not fn.endswith(".egg"): continue
+            with open(os.path.join(root, fn), "r") as f:
+                content = f.read()
+            for ref in TEXTUREREF.findall(content):
+                textures.add(os.path.basename(ref))
+    return sorted(textures)
+
+
+def cookTexture(imagePath, txoPath, divisor, compress):
+    """Load the image, scale it down by the given divisor, generate the
+    mipmaps and write everything to the txo file"""
+    image = PNMImage()
+    if not image.read(Filename.fromOsSpecific(imagePath)):
+        logging.error("could not read %s for cooking" % imagePath)
+        return False
+    if divisor > 1:
+        w = max(MINSIZE, image.getXSize() / divisor)
+        h = max(MINSIZE, image.getYSize() / divisor)
+        scaled = PNMImage(w, h, image.getNumChannels(), image.getMaxval())
+        scaled.gaussianFilterFrom(1.0, image)
+        image = scaled
+    tex = Texture(os.path.basename(imagePath))
+    tex.load(image)
+    tex.setMinfilter(Texture.FTLinearMipmapLinear)
+    tex.setMagfilter(Texture.FTLinear)
+    tex.generateRamMipmapImages()
+    if compress:
+        if tex.getNumComponents() == 4:
+            mode = Texture.CMDxt5
+        else:
+            mode = Texture.CMDxt1
+        if not tex.compressRamImage(mode):
+            logging.warning("could not compress %s" % imagePath)
+    return tex.write(Filename.fromOsSpecific(txoPath))
+
+
+def cookTextures(assetDir, outDir, compress=True):
+    """Cook all textures referenced by the models of the assetDir to all
+    quality tiers. Returns a tuple with the number of cooked files and the
+    list of texture basenames which are available as txo files."""
+    manifest = Manifest(os.path.join(outDir, "textures.json"))
+    options = "compress" if compress else "raw"
+    cooked = 0
+    keys = []
+    available = []
+    for texture in findModelTextures(assetDir):
+        imagePath = os.path.join(assetDir, texture)
+        if not os.path.exists(imagePath):
+            logging.warning("missing texture %s" % texture)
+            continue
+        done = True
+        for tier, divisor in TIERS.items():
+            txoPath = os.path.join(
+                getTierDir(outDir, tier),
+                os.path.splitext(texture)[0] + ".txo")
+            key = "%s/%s" % (tier, texture)
+            keys.append(key)
+            if not manifest.isStale(key, txoPath, [imagePath], options): continue
+            if not os.path.exists(os.path.dirname(txoPath)):
+                os.makedirs(os.path.dirname(txoPath))
+            logging.info("cook %s" % key)
+            if cookTexture(imagePath, txoPath, divisor, compress):
+                manifest.update(key, txoPath, [imagePath], options)
+                cooked += 1
+            else:
+                done = False
+        if done:
+            available.append(texture)
+    for output in manifest.prune(keys):
+        path = os.path.join(outDir, output)
+        if os.path.exists(path):
+            os.remove(path)
+    manifest.save()
+    return cooked, available
@@ -48,10 +48,51 @@ def setupDebugHelp(APP):
         APP.win.saveScreenshot(Filename.fromOsSpecific(path))
         logging.info(str.format("take Screenshot in: {0}", path))
 
-    # create a DirectObject object to handle the key input by the user
+    benchmark = []
+    def toggleSkinningBenchmark():
+        """Start the skinning benchmark with a growing number of golems in
+        front of the camera or stop the running one, the results will be
+        written to the log"""
+        from skinbenchmark import SkinningBenchmark
+        if benchmark:
+            benchmark.pop().stop()
+            return
+        benchmark.append(SkinningBenchmark())
+        benchmark[0].start()
+
+    qualityOverlay = []
+    def toggleQualityOverlay():
+        """Show the decisions of the adaptive quality controller in the
+        upper left corner"""
+        from direct.gui.OnscreenText import OnscreenText
+        from panda3d.core import TextNode
+        if qualityOverlay:
+            taskMgr.remove("qualityOverlayTask")
+            qualityOverlay.pop().destroy()
+            return
+        text = OnscreenText(
+            pos=(0.05, -0.1),
+            scale=0.04,
+            fg=(1, 1, 1, 1),
+            shadow=(0, 0, 0, 1),
+            align=TextNode.ALeft,
+            parent=base.a2dTopLeft,
+            mayChange=True)
+        qualityOverlay.append(text)
+        def updateOverlay(task):
+            controller = getattr(base, "qualityController", None)
+            if controller is None:
+                text.setText("quality controller not running")
+            else:
+                text.setText(controller.getStatusText())
+            return task.again
+        taskMgr.doMethodLater(0.5, updateOverlay, "qualityOverlayTask")
+
     directobject = DirectObject()
     directobject.accept("f2", analyze)
     directobject.accept("f3", explorer)
     directobject.accept("f4", toggleWireframe)
     directobject.accept("f5", takeScreenshot)
+    directobject.accept("f6", toggleSkinningBenchmark)
+    directobject.accept("f7", toggleQualityOverlay)
     directobject.accept("f12", toggleOobe)
@@ -1,5 +1,7 @@
 import random
-from direct.actor.Actor import Actor
+import actorlod
+import collidelayers
+from charactercontroller import CharacterController
 from direct.fsm.FSM import FSM
 from direct.showbase.DirectObject import DirectObject
 from panda3d.core import (
@@ -8,6 +10,7 @@ from panda3d.core import (
     CollisionSphere,
     NodePath,
     PandaNode,
+    Vec3,
     CollisionSegment)
 from direct.interval.IntervalGlobal import (
     Parallel,
@@ -17,31 +20,34 @@ from direct.interval.FunctionInterval import (
     Func)
 
 class Golem(FSM, DirectObject):
+    animations = {
+        "Idle":"Golem-Idle",
+        "Walk":"Golem-Walk",
+        "Attack":"Golem-Attack",
+        "Destroyed":"Golem-Destroyed"}
+    # all model files the golem needs, so they can be preloaded
+    models = ["Golem", "misc/Pointlight.egg"] + sorted(animations.values())
+
     def __init__(self):
         FSM.__init__(self, "FSM-Golem")
         random.seed()
-        self.golem = loader.loadModel("Golem")
-        self.golem = Actor("Golem", {
-            "Idle":"Golem-Idle",
-            "Walk":"Golem-Walk",
-            "Attack":"Golem-Attack",
-            "Destroyed":"Golem-Destroyed"})
+        self.golem = actorlod.loadActor("Golem", Golem.animations)
         self.golem.setBlend(frameBlend = True)
-        golemViewSphere = CollisionSphere(0, 0, 0.5, 6)
-        golemViewSphere.setTangible(False)
-        golemViewColNP = self.golem.attachNewNode(CollisionNode('golemViewField'))
-        golemViewColNP.node().addSolid(golemViewSphere)
+        # the trigger of the view field, only registered while started
+        self.viewTrigger = None
         golemHitSphere = CollisionSphere(0, 0, 0.5, 1)
         golemHitColNP = self.golem.attachNewNode(CollisionNode('golemHitField'))
         golemHitColNP.node().addSolid(golemHitSphere)
+        collidelayers.setSolid(golemHitColNP, "enemyHitbox")
+        # moves the golem along the ground and walls
+        self.controller = CharacterController(self.golem, 0.6, 2.0, ["floor", "wall"])
 
         # a collision segment to check attacks
         self.attackCheckSegment = CollisionSegment(0, 0, 1, 0, -1.3, 1)
         self.golemAttackRay = self.golem.attachNewNode(CollisionNode("golemAttackCollision"))
         self.golemAttackRay.node().addSolid(self.attackCheckSegment)
-        self.golemAttackRay.node().setIntoCollideMask(0)
+        collidelayers.setCollider(self.golemAttackRay, ["playerHitbox"])
         self.attackqueue = CollisionHandlerQueue()
-        base.cTrav.addCollider(self.golemAttackRay, self.attackqueue)
 
         attackAnim = self.golem.actorInterval("Attack", playRate = 2)
         self.AttackSeq = Parallel(
@@ -55,7 +61,7 @@ class Golem(FSM, DirectObject):
         self.lookatFloater.setPos(self.golem, 0, 0, 3.4)
         self.lookatFloater.hide()
         self.lookatFloater.reparentTo(render)
-        self.trackerObject = loader.loadModel("misc/Pointlight")
+        self.trackerObject = loader.loadModel("misc/Pointlight.egg")
         self.trackerObject.setColor(0, 1, 0)
         self.trackerObject.setScale(0.25)
         self.trackerObject.reparentTo(self.lookatFloater)
@@ -63,32 +69,69 @@ class Golem(FSM, DirectObject):
     def start(self, startPos):
         self.golem.setPos(startPos.getPos())
         self.golem.setHpr(startPos.getHpr())
+        self.controller.reset()
         self.golem.reparentTo(render)
+        self.golem.show()
         self.trackedEnemy = None
         self.health = 5
-        self.accept("playerCollision-in-golemViewField",
-                    lambda extraArgs: base.messenger.send("golemSeesPlayer", [self.golem]))
+        base.cTrav.addCollider(self.golemAttackRay, self.attackqueue)
+        self.viewTrigger = base.triggers.addSphere(
+            self.golem, (0, 0, 0.5), 6, self.__viewFieldEntered, dynamic=True)
 
     def stop(self):
         self.trackedEnemy = None
-        taskMgr.remove("GolemAI_task")
+        base.simulation.removeStep("golemAI")
+        base.simulation.removeInterpolated(self.golem)
+        base.simulation.removeInterpolated(self.lookatFloater)
         self.golem.hide()
         self.ignoreAll()
+        self.__removeViewTrigger()
+        base.cTrav.removeCollider(self.golemAttackRay)
+
+    def __removeViewTrigger(self):
+        if self.viewTrigger is None: return
+        base.triggers.removeTrigger(self.viewTrigger)
+        self.viewTrigger = None
+
+    def __viewFieldEntered(self, inside):
+        if inside:
+            base.messenger.send("golemSeesPlayer", [self.golem])
+
+    def reset(self):
+        """Stop the golem and bring it back to the state right after it has
+        been created, so it can be started again in a new world"""
+        self.stop()
+        self.AttackSeq.pause()
+        self.attackqueue.clearEntries()
+        self.request("Off")
+        self.golem.stop()
+        self.golem.pose("Idle", 0)
+        self.golem.clearColorScale()
+        self.golem.detachNode()
+        self.trackerObject.setColor(0, 1, 0)
+        self.lookatFloater.hide()
 
     def cleanup(self):
         self.stop()
         self.lookatFloater.removeNode()
+        self.controller.cleanup()
         self.golem.cleanup()
         self.golem.removeNode()
 
+    def setHeightField(self, heightField):
+        """Use the baked floor heights of the level for the ground"""
+        self.controller.setHeightField(heightField)
+
     def activate(self, trackedEnemy):
         self.trackedEnemy = trackedEnemy
-        taskMgr.add(self.aiTask, "GolemAI_task")
+        base.simulation.addStep("golemAI", self.aiStep, sort=20)
+        base.simulation.addInterpolated(self.golem)
+        base.simulation.addInterpolated(self.lookatFloater)
         self.lookatFloater.show()
 
-    def aiTask(self, task):
-        dt = globalClock.getDt()
-        if self.AttackSeq.isPlaying(): return task.cont
+    def aiStep(self, dt):
+        """Simulation step of the golem, dt is the fixed tick length"""
+        if self.AttackSeq.isPlaying(): return
 
         self.lookatFloater.setPos(self.golem, 0, 0, 3.4)
         self.lookatFloater.lookAt(self.trackedEnemy)
@@ -111,11 +154,10 @@ class Golem(FSM, DirectObject):
                 if self.state != "Idle":
                     self.request("Idle")
         else:
-            self.golem.setY(self.golem, -0.5 * dt)
+            self.controller.move(render.getRelativeVector(self.golem, Vec3(0, -0.5 * dt, 0)))
             if self.state != "Walk":
                 self.request("Walk")
-
-        return task.cont
+        self.controller.update(dt)
 
     def hit(self):
         hitInterval = Sequence(
@@ -153,12 +195,10 @@ class Golem(FSM, DirectObject):
             self.request("Destroyed")
 
     def ceckAttack(self):
-        for i in range(self.attackqueue.getNumEntries()):
-            entry = self.attackqueue.getEntry(i)
-            into = entry.getIntoNode()
-            if "playerCollision" in into.getName():
-                if random.random() > .5:
-                    base.messenger.send("HitPlayer")
+        # the attack segment only tests the player hitbox
+        if self.attackqueue.getNumEntries() > 0:
+            if random.random() > .5:
+                base.messenger.send("HitPlayer")
 
     def enterIdle(self):
         self.golem.loop("Idle")
@@ -172,7 +212,10 @@ class Golem(FSM, DirectObject):
 
     def enterDestroyed(self):
         self.ignoreAll()
-        taskMgr.remove("GolemAI_task")
+        self.__removeViewTrigger()
+        base.simulation.removeStep("golemAI")
+        base.simulation.removeInterpolated(self.golem)
+        base.simulation.removeInterpolated(self.lookatFloater)
         self.AttackSeq.finish()
         self.golem.play("Destroyed")
         self.lookatFloater.hide()
@@ -0,0 +1,181 @@
+"""Texture atlases which pack several small images into one texture, and
+batches which render any number of cards of one atlas with a single geom"""
+import math
+import logging
+from panda3d.core import (
+    PNMImage,
+    Texture,
+    Filename,
+    VirtualFileSystem,
+    getModelPath,
+    GeomVertexFormat,
+    GeomVertexData,
+    GeomVertexWriter,
+    GeomTriangles,
+    Geom,
+    GeomNode,
+    NodePath,
+    OmniBoundingVolume,
+    TextureStage,
+    TransparencyAttrib)
+
+# the images packed into each atlas
+ATLASES = {
+    "digits": ["%d.png" % i for i in range(11)],
+    "hud": ["HeartIcon.png", "Keys.png"]}
+# the atlases which have been built already by their name
+atlases = {}
+
+
+def getAtlas(name):
+    """Return the atlas with the given name, it will be built the first time
+    it is requested"""
+    if name not in atlases:
+        atlases[name] = TextureAtlas(name, ATLASES[name])
+    return atlases[name]
+
+
+def getPowerOfTwo(value):
+    return 2 ** int(math.ceil(math.log(max(1, value), 2)))
+
+
+class TextureAtlas():
+    def __init__(self, name, imageNames):
+        vfs = VirtualFileSystem.getGlobalPtr()
+        images = []
+        cellWidth = 1
+        cellHeight = 1
+        for imageName in imageNames:
+            fn = Filename(imageName)
+            vfs.resolveFilename(fn, getModelPath().getValue())
+            image = PNMImage()
+            if not image.read(fn):
+                logging.error("could not read %s for atlas %s" % (imageName, name))
+                image = PNMImage(1, 1, 4)
+            images.append((imageName, image))
+            cellWidth = max(cellWidth, image.getXSize())
+            cellHeight = max(cellHeight, image.getYSize())
+        columns = int(math.ceil(math.sqrt(len(images))))
+        rows = int(math.ceil(len(images) / float(columns)))
+        width = getPowerOfTwo(columns * cellWidth)
+        height = getPowerOfTwo(rows * cellHeight)
+        atlasImage = PNMImage(width, height, 4)
+        atlasImage.alphaFill(0)
+        # the texture coordinates (left, bottom, right, top) of each image,
+        # moved inside by half a texel so no neighbour bleeds into a card
+        self.regions = {}
+        for i, (imageName, image) in enumerate(images):
+            x = (i % columns) * cellWidth
+            y = (i / columns) * cellHeight
+            atlasImage.copySubImage(image, x, y)
+            self.regions[imageName] = (
+                (x + 0.5) / width,
+                1.0 - (y + image.getYSize() - 0.5) / height,
+                (x + image.getXSize() - 0.5) / width,
+                1.0 - (y + 0.5) / height)
+        self.texture = Texture(name)
+        self.texture.load(atlasImage)
+        self.texture.setMinfilter(Texture.FTLinear)
+        self.texture.setMagfilter(Texture.FTLinear)
+        self.texture.setWrapU(Texture.WMClamp)
+        self.texture.setWrapV(Texture.WMClamp)
+
+    def getRegion(self, imageName):
+        return self.regions[imageName]
+
+    def makeCard(self, imageName, frame=(-1, 1, -1, 1)):
+        """Create a single card showing the given image of the atlas, frame
+        is (left, right, bottom, top) like the one of CardMaker"""
+        batch = CardBatch(self, imageName, 1)
+        batch.setCard(0, imageName, (0, 0, 0), frame)
+        return batch.nodePath
+
+
+class CardBatch():
+    """A fixed number of cards showing images of one atlas, all drawn with a
+    single geom. Cards are in the X/Z plane or, for billboards, turned to the
+    camera every frame."""
+    def __init__(self, atlas, name, numCards, billboard=False):
+        self.atlas = atlas
+        self.billboard = billboard
+        # the (position, frame) of each shown card or None if hidden
+        self.cards = [None] * numCards
+        vdata = GeomVertexData(name, GeomVertexFormat.getV3t2(), Geom.UHDynamic)
+        vdata.setNumRows(numCards * 4)
+        tris = GeomTriangles(Geom.UHStatic)
+        for i in range(numCards):
+            tris.addVertices(i * 4, i * 4 + 1, i * 4 + 2)
+            tris.addVertices(i * 4, i * 4 + 2, i * 4 + 3)
+        geom = Geom(vdata)
+        geom.addPrimitive(tris)
+        node = GeomNode(name)
+        node.addGeom(geom)
+        # the vertices are rewritten in place without updating the bounds,
+        # so the batch is never culled
+        node.setBounds(OmniBoundingVolume())
+        node.setFinal(True)
+        self.geom = node.modifyGeom(0)
+        self.nodePath = NodePath(node)
+        # the cards have no normals, they replace the lit color with the
+        # texture, so they always show fully bright
+        textureStage = TextureStage("cardBatch")
+        textureStage.setMode(TextureStage.MReplace)
+        self.nodePath.setTexture(textureStage, atlas.texture)
+        self.nodePath.setLightOff()
+        self.nodePath.setAttrib(TransparencyAttrib.make(TransparencyAttrib.MAlpha))
+        self.taskName = "cardBatch-%s-%d" % (name, id(self))
+        for i in range(numCards):
+            self.hideCard(i)
+        if billboard:
+            taskMgr.add(self.__billboardTask, self.taskName, sort=49)
+
+    def setCard(self, index, imageName, pos, frame=(-0.5, 0.5, -0.5, 0.5)):
+        """Show the card with the given index at the position"""
+        left, bottom, right, top = self.atlas.getRegion(imageName)
+        texcoord = GeomVertexWriter(self.geom.modifyVertexData(), "texcoord")
+        texcoord.setRow(index * 4)
+        texcoord.setData2f(left, bottom)
+        texcoord.setData2f(right, bottom)
+        texcoord.setData2f(right, top)
+        texcoord.setData2f(left, top)
+        self.cards[index] = (pos, frame)
+        self.__writeCard(index, (1, 0, 0), (0, 0, 1))
+
+    def hideCard(self, index):
+        """Collapse the card, so it doesn't cover any pixels"""
+        self.cards[index] = None
+        vertex = GeomVertexWriter(self.geom.modifyVertexData(), "vertex")
+        vertex.setRow(index * 4)
+        for i in range(4):
+            vertex.setData3f(0, 0, 0)
+
+    def hideAll(self):
+        for i in range(len(self.cards)):
+            self.hideCard(i)
+
+    def __writeCard(self, index, right, up):
+        pos, frame = self.cards[index]
+        left, rightEdge, bottom, top = frame
+        vertex = GeomVertexWriter(self.geom.modifyVertexData(), "vertex")
+        vertex.setRow(index * 4)
+        for x, z in ((left, bottom), (rightEdge, bottom), (rightEdge, top), (left, top)):
+            vertex.setData3f(
+                pos[0] + right[0] * x + up[0] * z,
+                pos[1] + right[1] * x + up[1] * z,
+                pos[2] + right[2] * x + up[2] * z)
+
+    def __billboardTask(self, task):
+        if self.nodePath.isEmpty() or self.nodePath.isHidden():
+            return task.cont
+        shown = [i for i in range(len(self.cards)) if self.cards[i] is not None]
+        if not shown: return task.cont
+        quat = base.cam.getQuat(self.nodePath)
+        right = quat.getRight()
+        up = quat.getUp()
+        for i in shown:
+            self.__writeCard(i, right, up)
+        return task.cont
+
+    def removeNode(self):
+        taskMgr.remove(self.taskName)
+        self.nodePath.removeNode()
@@ -68,10 +68,30 @@ class GameOverScreen():
             clickSound = None)
         self.btnContinue.setTransparency(1)
         self.btnContinue.reparentTo(self.frameMain)
+
+        self.btnPlayAgain = DirectButton(
+            scale = (0.25, 0.25, 0.25),
+            text = _("Play again"),
+            text_scale = (0.5, 0.5, 0.5),
+            text_align = TextNode.ACenter,
+            text_pos = (0, 0),
+            text_fg = (1,1,1,1),
+            text_shadow = (0.3, 0.3, 0.1, 1),
+            text_shadowOffset = (0.05, 0.05),
+            relief = 1,
+            frameColor = (0,0,0,0),
+            pressEffect = False,
+            pos = (0, 0, -0.5),
+            command = lambda: base.messenger.send("PlayAgain"),
+            rolloverSound = None,
+            clickSound = None)
+        self.btnPlayAgain.setTransparency(1)
+        self.btnPlayAgain.reparentTo(self.frameMain)
         self.hide()
 
     def show(self, winLoose, resulttime):
         if winLoose == "win":
+            self.lblWin["text"] = _("You Succeeded")
             timestring = "%d:%02d" % (resulttime/60, resulttime%60)
             self.lblResult["text"] = timestring
             self.lblTime.show()
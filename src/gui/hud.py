@@ -1,31 +1,21 @@
-from direct.gui.OnscreenImage import OnscreenImage
 from direct.gui.DirectLabel import DirectLabel
 from panda3d.core import TextNode
+from gui.atlas import CardBatch, getAtlas
 
 class PlayerHUD():
+    # the atlas of the hud icons, so it can be preloaded
+    atlases = ["hud"]
+    # the positions of the heart icons
+    heartPositions = [(0.2, 0, -0.15), (0.45, 0, -0.15), (0.7, 0, -0.15)]
+
     def __init__(self):
         #
         # Player status section
         #
-        heartscale = (0.1, 1, 0.1)
-        self.heart1 = OnscreenImage(
-            image = "HeartIcon.png",
-            scale = heartscale,
-            pos = (0.2, 0, -0.15))
-        self.heart1.setTransparency(True)
-        self.heart1.reparentTo(base.a2dTopLeft)
-        self.heart2 = OnscreenImage(
-            image = "HeartIcon.png",
-            scale = heartscale,
-            pos = (0.45, 0, -0.15))
-        self.heart2.setTransparency(True)
-        self.heart2.reparentTo(base.a2dTopLeft)
-        self.heart3 = OnscreenImage(
-            image = "HeartIcon.png",
-            scale = heartscale,
-            pos = (0.7, 0, -0.15))
-        self.heart3.setTransparency(True)
-        self.heart3.reparentTo(base.a2dTopLeft)
+        # all heart icons are drawn from the hud atlas in one geom
+        atlas = getAtlas("hud")
+        self.hearts = CardBatch(atlas, "hearts", len(PlayerHUD.heartPositions))
+        self.hearts.nodePath.reparentTo(base.a2dTopLeft)
 
         self.keys = DirectLabel(
             text = "x0",
@@ -34,7 +24,7 @@ class PlayerHUD():
             text_scale = 1.8,
             text_pos = (1, -0.25, 0),
             text_align = TextNode.ALeft,
-            image = "Keys.png",
+            image = atlas.makeCard("Keys.png"),
             pos = (0.2, 0, -0.4))
         self.keys.setScale(0.085)
         self.keys.setTransparency(True)
@@ -54,9 +44,7 @@ class PlayerHUD():
         self.keys.show()
 
     def hide(self):
-        self.heart1.hide()
-        self.heart2.hide()
-        self.heart3.hide()
+        self.hearts.hideAll()
         self.keys.hide()
         self.hideActionKey()
 
@@ -64,12 +52,15 @@ class PlayerHUD():
         """this function will set the health image in the top righthand corner
         according to the given value, where value is a integer between 0 and 100
         """
-        if value >= 1: self.heart1.show()
-        else: self.heart1.hide()
-        if value >= 2: self.heart2.show()
-        else: self.heart2.hide()
-        if value >= 3: self.heart3.show()
-        else: self.heart3.hide()
+        for i in range(len(PlayerHUD.heartPositions)):
+            if value >= i + 1:
+                self.hearts.setCard(
+                    i,
+                    "HeartIcon.png",
+                    PlayerHUD.heartPositions[i],
+                    (-0.1, 0.1, -0.1, 0.1))
+            else:
+                self.hearts.hideCard(i)
 
     def showActionKey(self):
         self.actionKey.show()
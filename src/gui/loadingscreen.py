@@ -2,7 +2,9 @@
 from direct.gui.DirectGui import DirectFrame
 from direct.gui.DirectGui import DirectWaitBar
 from direct.gui.DirectGui import DirectLabel
-from panda3d.core import TextNode
+from direct.interval.IntervalGlobal import Sequence
+from direct.interval.LerpInterval import LerpColorScaleInterval
+from panda3d.core import TextNode, LVecBase4f
 
 
 class LoadingScreen():
@@ -39,15 +41,29 @@ class LoadingScreen():
             barColor = (0.5, 0.4, 0.1, 1),
             frameColor = (0.1, 0.1, 0.1, 1))
         self.wbLoading.reparentTo(self.frameMain)
+        self.lblLoading.setTransparency(1)
+
+        # let the loading text pulse, so the player can see that the game is
+        # still running while the world gets loaded in the background
+        self.pulse = Sequence(
+            LerpColorScaleInterval(
+                self.lblLoading,
+                0.75,
+                LVecBase4f(1.0,1.0,1.0,0.4),
+                LVecBase4f(1.0,1.0,1.0,1.0)),
+            LerpColorScaleInterval(
+                self.lblLoading,
+                0.75,
+                LVecBase4f(1.0,1.0,1.0,1.0),
+                LVecBase4f(1.0,1.0,1.0,0.4)),
+            name="loadingPulse")
 
     def show(self):
         self.frameMain.show()
-        # and render two frames so the loading screen
-        # is realy shown on screen
-        base.graphicsEngine.renderFrame()
-        base.graphicsEngine.renderFrame()
+        self.pulse.loop()
 
     def hide(self):
+        self.pulse.finish()
         self.frameMain.hide()
 
     def setLoadingValue(self, value):
@@ -57,6 +73,4 @@ class LoadingScreen():
         if value < 0: value = 0
         self.wbLoading["value"] = value
         self.wbLoading["text"] = "{0}%".format(value)
-        base.graphicsEngine.renderFrame()
-        base.graphicsEngine.renderFrame()
 
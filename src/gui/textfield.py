@@ -10,7 +10,13 @@ import logging
 from direct.showbase.DirectObject import DirectObject
 from direct.gui.DirectGui import DGG
 from direct.gui.DirectGui import DirectFrame
-from panda3d.core import TextNode
+from panda3d.core import (
+    TextNode,
+    CardMaker,
+    NodePath,
+    Point3,
+    ScissorEffect,
+    TransparencyAttrib)
 
 
 class MessageWriter(DirectObject):
@@ -30,20 +36,33 @@ class MessageWriter(DirectObject):
 
         # the textfield to put instructions hints and everything else, that
         # should be slowly written on screen and disappear after a short while
+        self.textfieldNodePath = aspect2d.attachNewNode("textfield")
+        self.textfieldNodePath.setPos(base.a2dLeft+0.2, 0, -0.4)
+        cm = CardMaker("textfieldCard")
+        cm.setFrame(
+            -0.1, base.a2dRight*2-0.3,
+            base.a2dBottom+0.5, 0.1)
+        cm.setColor(0,0,0,0.45)
+        card = self.textfieldNodePath.attachNewNode(cm.generate())
+        card.setTransparency(TransparencyAttrib.MAlpha)
+        # the text is laid out in font units and scaled by its node, so the
+        # positions the TextNode calculates match the generated geometry
+        textScale = 0.06
+        self.textScaleNodePath = self.textfieldNodePath.attachNewNode("textScale")
+        self.textScaleNodePath.setScale(textScale)
+        # the TextNode is only used to lay out and generate the text, its
+        # geometry is shown twice, once for the fully written rows and once
+        # for the row which is currently written, each with a scissor
         self.textfield = TextNode('textfield')
         self.textfield.clearText()
         self.textfield.setShadow(0.005, 0.005)
         self.textfield.setShadowColor(0, 0, 0, 1)
-        self.textfield.setWordwrap(base.a2dRight*2-0.4)
-        self.textfield.setCardActual(
-            -0.1, base.a2dRight*2-0.3,
-            0.1, base.a2dBottom+0.5)
-        self.textfield.setCardColor(0,0,0,0.45)
-        self.textfield.setFlattenFlags(TextNode.FF_none)
-        self.textfield.setTextScale(0.06)
-        self.textfieldNodePath = aspect2d.attachNewNode(self.textfield)
-        self.textfieldNodePath.setScale(1)
-        self.textfieldNodePath.setPos(base.a2dLeft+0.2, 0, -0.4)
+        self.textfield.setWordwrap((base.a2dRight*2-0.4) / textScale)
+        self.writtenRows = self.textScaleNodePath.attachNewNode("writtenRows")
+        self.currentRow = self.textScaleNodePath.attachNewNode("currentRow")
+        self.textGeom = None
+        # the (row, right edge) of each character of the word wrapped text
+        self.signPositions = []
 
         self.hide()
 
@@ -51,7 +70,7 @@ class MessageWriter(DirectObject):
         self.textfieldNodePath.show()
 
     def hide(self):
-        self.textfield.clearText()
+        self.__removeText()
         self.textfieldNodePath.hide()
 
     def clear(self):
@@ -62,7 +81,7 @@ class MessageWriter(DirectObject):
         self.writeDone = False
         self.currentSign = 0
         self.lastSign = 0.0
-        self.textfield.clearText()
+        self.__removeText()
 
     def cleanup(self):
         """Function that should be called to remove and reset the
@@ -72,9 +91,73 @@ class MessageWriter(DirectObject):
 
     def run(self):
         """This function can be called to start the writer task."""
-        self.textfield.setFlattenFlags(TextNode.FF_none)
+        self.__generateText()
         taskMgr.add(self.__writeText, "writeText", priority=30)
 
+    def __removeText(self):
+        self.textfield.clearText()
+        self.signPositions = []
+        if self.textGeom is not None:
+            self.textGeom.removeNode()
+            self.textGeom = None
+        self.writtenRows.removeChildren()
+        self.currentRow.removeChildren()
+
+    def __generateText(self):
+        """Generate the geometry of the whole text once and calculate where
+        each character ends, the characters will be revealed by moving the
+        scissors of the rows"""
+        self.__removeText()
+        self.textfield.setText(self.textfieldText)
+        self.textGeom = NodePath(self.textfield.generate())
+        self.textGeom.instanceTo(self.writtenRows)
+        self.textGeom.instanceTo(self.currentRow)
+        row = 0
+        x = 0.0
+        # the messages are encoded byte strings, iterate the decoded text so
+        # each character is measured as a whole
+        for sign in self.textfield.getWordwrappedWtext():
+            if sign == u"\n":
+                row += 1
+                x = 0.0
+            else:
+                x += self.textfield.calcWidth(sign)
+            self.signPositions.append((row, x))
+        self.__revealText(0)
+
+    def __revealText(self, numSigns):
+        """Show the given number of characters of the generated text"""
+        if numSigns >= len(self.signPositions):
+            self.writtenRows.clearEffect(ScissorEffect.getClassType())
+            self.currentRow.hide()
+            return
+        if numSigns == 0:
+            row, x = (0, 0.0)
+        else:
+            row, x = self.signPositions[numSigns - 1]
+            if row != self.signPositions[numSigns][0]:
+                # the next character starts a new row
+                row, x = (self.signPositions[numSigns][0], 0.0)
+        # the rows are lineHeight apart with their baseline at the bottom
+        lineHeight = self.textfield.getLineHeight()
+        rowTop = -row * lineHeight + 0.75 * lineHeight
+        rowBottom = rowTop - lineHeight
+        left = -lineHeight
+        right = self.textfield.getWordwrap() + lineHeight
+        if row == 0:
+            self.writtenRows.hide()
+        else:
+            self.writtenRows.show()
+            self.writtenRows.setEffect(ScissorEffect.makeNode(
+                Point3(left, 0, rowTop),
+                Point3(right, 0, 2 * lineHeight),
+                self.textScaleNodePath))
+        self.currentRow.show()
+        self.currentRow.setEffect(ScissorEffect.makeNode(
+            Point3(left, 0, rowBottom),
+            Point3(x, 0, rowTop),
+            self.textScaleNodePath))
+
     def setMessageAndShow(self, message):
         """Function to simply add a new message and show it if no other
         message is currently shown"""
@@ -92,20 +175,16 @@ class MessageWriter(DirectObject):
             self.clear()
             return task.done
 
-        if self.currentSign == len(self.textfieldText)-1:
-            self.textfield.setFlattenFlags(TextNode.FF_dynamic_merge)
-
-        if self.currentSign >= len(self.textfieldText):
+        if self.currentSign >= len(self.signPositions):
             # check if the text is fully written
             if task.time - self.lastSign >= self.showlength:
                 # now also check if the time the text should
                 # be visible on screen has elapsed
                 self.stop = True
-                self.textfieldNodePath.flattenStrong()
         elif (task.time - self.lastSign > base.textWriteSpeed) and (not self.stop):
-            # write the next letter of the text
-            self.textfield.appendText(self.textfieldText[self.currentSign])
+            # reveal the next letter of the already generated text
             self.currentSign += 1
+            self.__revealText(self.currentSign)
             self.lastSign = task.time
 
         return task.cont
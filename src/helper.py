@@ -1,6 +1,25 @@
 from pandac.PandaModules import WindowProperties
+import __builtin__
+import logging
+import time
 import sys
 
+def initGamepadSupport():
+    """Initialize pygame for the gamepad support the first time it is needed
+    instead of on every application start. Returns True if gamepads can be
+    used."""
+    if __builtin__.gamepadSupport is None:
+        try:
+            # Pygame for gamepad support
+            import pygame
+            pygame.init()
+            __builtin__.gamepadSupport = True
+            logging.info("gamepads support enabled")
+        except:
+            __builtin__.gamepadSupport = False
+            logging.info("gamepads support disabled")
+    return __builtin__.gamepadSupport
+
 def hide_cursor():
     """set the Cursor invisible"""
     props = WindowProperties()
@@ -22,3 +41,18 @@ def show_cursor():
     else:
         props.setCursorFilename(win)
     base.win.requestProperties(props)
+
+def prepareGraphics(nodePaths):
+    """Upload the textures, vertex buffers and shaders of the given scenes to
+    the graphics card right now instead of lazily on their first draw.
+    Returns the number of uploaded objects and the time it took in seconds."""
+    gsg = base.win.getGsg()
+    prepared = gsg.getPreparedObjects()
+    numBefore = prepared.getNumPrepared()
+    start = time.time()
+    for nodePath in nodePaths:
+        nodePath.prepareScene(gsg)
+    # the queued objects will be uploaded while rendering the next frame
+    base.graphicsEngine.renderFrame()
+    base.graphicsEngine.syncFrame()
+    return prepared.getNumPrepared() - numBefore, time.time() - start
@@ -0,0 +1,66 @@
+"""A grid of the floor heights of the level, baked by the level cooker from the
+floor collision, so the height of the ground below a position can be looked up
+without a collision traversal."""
+import math
+import base64
+import logging
+from array import array
+from panda3d.core import PandaNode
+
+# the height of cells without any floor
+NOFLOOR = -1.0e9
+
+
+class HeightField():
+    def __init__(self, minX, minY, cellSize, columns, rows, heights):
+        self.minX = minX
+        self.minY = minY
+        self.cellSize = cellSize
+        self.columns = columns
+        self.rows = rows
+        # the highest floor height of each cell, row by row
+        self.heights = heights
+
+    def getHeight(self, x, y):
+        """Return the floor height at the given position in level space or
+        None if there is no floor"""
+        column = int(math.floor((x - self.minX) / self.cellSize))
+        row = int(math.floor((y - self.minY) / self.cellSize))
+        if column < 0 or row < 0 or column >= self.columns or row >= self.rows:
+            return None
+        height = self.heights[row * self.columns + column]
+        if height <= NOFLOOR:
+            return None
+        return height
+
+    def makeNode(self):
+        """Store the height field in the tags of a node, so it will be written
+        into the cooked level model"""
+        node = PandaNode("heightField")
+        node.setTag("minX", repr(self.minX))
+        node.setTag("minY", repr(self.minY))
+        node.setTag("cellSize", repr(self.cellSize))
+        node.setTag("columns", str(self.columns))
+        node.setTag("rows", str(self.rows))
+        node.setTag("heights", base64.b64encode(self.heights.tostring()))
+        return node
+
+
+def loadHeightField(model):
+    """Return the height field baked into the level model or None if the
+    model hasn't been cooked"""
+    nodePath = model.find("heightField")
+    if nodePath.isEmpty():
+        return None
+    heights = array("f")
+    heights.fromstring(base64.b64decode(nodePath.getTag("heights")))
+    heightField = HeightField(
+        float(nodePath.getTag("minX")),
+        float(nodePath.getTag("minY")),
+        float(nodePath.getTag("cellSize")),
+        int(nodePath.getTag("columns")),
+        int(nodePath.getTag("rows")),
+        heights)
+    logging.info("loaded height field with %dx%d cells" % (
+        heightField.columns, heightField.rows))
+    return heightField
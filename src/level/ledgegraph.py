@@ -0,0 +1,91 @@
+"""The ledges of the level the player jumps off, baked by the level cooker from
+the floor height field. Each ledge is a cell of the height field with the
+directions the floor drops away in and the landing point of a jump in that
+direction."""
+import math
+import base64
+import logging
+from array import array
+from panda3d.core import (
+    PandaNode,
+    Point3)
+
+# the directions a ledge can face, the index is stored with the ledge
+DIRECTIONS = [
+    (1, 0), (1, 1), (0, 1), (-1, 1),
+    (-1, 0), (-1, -1), (0, -1), (1, -1)]
+# the largest angle between the facing of the player and a ledge direction
+# that still counts as jumping off the ledge
+MAXANGLE = 25.0
+
+
+class LedgeGraph():
+    def __init__(self, heightField, cells, directions, landings):
+        self.heightField = heightField
+        self.minDot = math.cos(math.radians(MAXANGLE))
+        # the ledges by the index of their height field cell, each with a
+        # list of (direction, landing point)
+        self.ledges = {}
+        for i in range(len(cells)):
+            self.ledges.setdefault(cells[i], []).append((
+                directions[i],
+                Point3(landings[i * 3], landings[i * 3 + 1], landings[i * 3 + 2])))
+
+    def findJump(self, pos, forward):
+        """Return the landing point of a jump off the ledge at the given
+        position in the direction the character is facing or None if it
+        doesn't stand at a ledge facing it"""
+        heightField = self.heightField
+        column = int(math.floor((pos.getX() - heightField.minX) / heightField.cellSize))
+        row = int(math.floor((pos.getY() - heightField.minY) / heightField.cellSize))
+        if column < 0 or column >= heightField.columns or row < 0 or row >= heightField.rows:
+            return None
+        ledges = self.ledges.get(row * heightField.columns + column)
+        if ledges is None:
+            return None
+        length = math.hypot(forward.getX(), forward.getY())
+        if length == 0:
+            return None
+        best = None
+        bestDot = self.minDot
+        for direction, landing in ledges:
+            dx, dy = DIRECTIONS[direction]
+            dot = (forward.getX() * dx + forward.getY() * dy) / (length * math.hypot(dx, dy))
+            if dot >= bestDot:
+                best = landing
+                bestDot = dot
+        return best
+
+    def makeNode(self):
+        """Store the ledges in the tags of a node, so they will be written
+        into the cooked level model"""
+        cells = array("i")
+        directions = array("b")
+        landings = array("f")
+        for cell, ledges in self.ledges.items():
+            for direction, landing in ledges:
+                cells.append(cell)
+                directions.append(direction)
+                landings.extend([landing.getX(), landing.getY(), landing.getZ()])
+        node = PandaNode("ledgeGraph")
+        node.setTag("cells", base64.b64encode(cells.tostring()))
+        node.setTag("directions", base64.b64encode(directions.tostring()))
+        node.setTag("landings", base64.b64encode(landings.tostring()))
+        return node
+
+
+def loadLedgeGraph(model, heightField):
+    """Return the ledges baked into the level model or None if the model
+    hasn't been cooked"""
+    nodePath = model.find("ledgeGraph")
+    if nodePath.isEmpty() or heightField is None:
+        return None
+    cells = array("i")
+    cells.fromstring(base64.b64decode(nodePath.getTag("cells")))
+    directions = array("b")
+    directions.fromstring(base64.b64decode(nodePath.getTag("directions")))
+    landings = array("f")
+    landings.fromstring(base64.b64decode(nodePath.getTag("landings")))
+    ledgeGraph = LedgeGraph(heightField, cells, directions, landings)
+    logging.info("loaded %d ledges" % len(cells))
+    return ledgeGraph
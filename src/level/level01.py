@@ -6,16 +6,8 @@ from panda3d.core import (
     Spotlight,
     PointLight,
     PerspectiveLens,
-    Filename,
     CollideMask,
-    CollisionSphere,
-    CollisionBox,
-    CollisionPlane,
-    CollisionNode,
-    BillboardEffect,
-    CardMaker,
-    TextureStage,
-    TransparencyAttrib,
+    NodePath,
     Plane,
     Vec3,
     Point3)
@@ -27,12 +19,30 @@ from direct.interval.FunctionInterval import (
     Wait)
 from direct.interval.AnimControlInterval import AnimControlInterval
 from direct.showbase.DirectObject import DirectObject
-from direct.particles.ParticleEffect import ParticleEffect
+from level.roomculler import RoomCuller
+from level.lightassigner import LightAssigner
+from level.particlelod import ParticleLOD, createEffect
+from level.heightfield import loadHeightField
+from level.ledgegraph import loadLedgeGraph
+from gui.atlas import CardBatch, getAtlas
+import collidelayers
 
 class Level01(DirectObject):
+    # all model files the level needs, so they can be preloaded
+    models = [
+        "Level", "Key", "Artifact", "Heart",
+        "Switch-Activate", "Box_long_looseLid-open",
+        "Boulder_Door-open", "Wood_Door_Basic-open"]
+    # the atlas of the switch number signs
+    atlases = ["digits"]
+
     def __init__(self):
         # Level model
         self.level = loader.loadModel("Level")
+        collidelayers.applyLevelLayers(self.level)
+        # the floor heights baked by the level cooker
+        self.heightField = loadHeightField(self.level)
+        self.ledgeGraph = loadLedgeGraph(self.level, self.heightField)
         self.key = loader.loadModel("Key")
         self.artifact = loader.loadModel("Artifact")
 
@@ -75,9 +85,19 @@ class Level01(DirectObject):
         self.activePostsign = None
         self.activeBox = None
         self.activeDoor = None
+        self.chestAnimation = None
 
         self.numKeys = 0
 
+        # only render the rooms which can be seen through the open doors
+        self.roomCuller = RoomCuller(self.level)
+        # only let the nearest torches shine on each object
+        self.lightAssigner = LightAssigner()
+        # pause the torch effects which can't be seen
+        self.particleLOD = ParticleLOD()
+        # the trigger volumes of the interactive objects
+        self.triggers = []
+
         # Set up all the little details
         if base.particleMgrEnabled:
             self.initTorchParticles()
@@ -89,22 +109,16 @@ class Level01(DirectObject):
         self.initChests()
         self.initHearts()
 
-        plane = self.level.find("**/Deathplane")
-        deathplane = CollisionPlane(Plane((0, 0, 1), (0,0,-1)))
-        deathplane.setTangible(False)
-        self.deathplaneColNP = render.attachNewNode(CollisionNode('deathplane'))
-        self.deathplaneColNP.node().addSolid(deathplane)
-        self.accept("playerCollision-in-deathplane", lambda args: base.messenger.send("player-die"))
-
     def initTorchParticles(self):
         torchTops = self.level.findAllMatches("**/TorchTop*")
         fxList = ['TorchSmoke.ptf', 'TorchFire.ptf']
         for torch in torchTops:
             for fx in fxList:
-                p = ParticleEffect()
-                p.loadConfig(Filename(fx))
+                p = createEffect(fx)
                 p.setPos(torch.getPos(render))
                 p.start(self.level)
+                self.particleLOD.addEffect(p)
+                self.roomCuller.addEffect(p, self.particleLOD)
 
     def initLights(self):
         torches = self.level.findAllMatches("**/TorchTop*")
@@ -114,12 +128,22 @@ class Level01(DirectObject):
             tLight.setColor((.4, .2, .0, 1))
             tlnp = render.attachNewNode(tLight)
             tlnp.setPos(torch.getPos(render))
-            render.setLight(tlnp)
+            self.lightAssigner.addLight(tlnp)
+            self.roomCuller.addLight(tlnp, self.lightAssigner)
             self.lights.append(tlnp)
+        # the static geometry is split into one cell per room if the level
+        # has been cooked, so every room gets its own lights
+        for child in self.level.getChildren():
+            if child.getName() == "static":
+                for cell in child.getChildren():
+                    self.lightAssigner.addStatic(cell)
+            else:
+                self.lightAssigner.addStatic(child)
+        self.lightAssigner.addMover(self.key)
+        self.lightAssigner.addMover(self.artifact)
 
         windows = self.level.findAllMatches("**/Window*")
         plates = self.level.findAllMatches("**/Plate*")
-        spikes = self.level.findAllMatches("**/Spikes*")
         for window in windows:
             wLight = Spotlight(window.getName())
             lens = PerspectiveLens()
@@ -130,6 +154,7 @@ class Level01(DirectObject):
             wlnp.lookAt((0, window.getY(), 0))
             for plate in plates:
                 plate.setLight(wlnp)
+                self.roomCuller.addLight(wlnp, plate)
             self.lights.append(wlnp)
 
         ambientLight = AmbientLight("ambientLight")
@@ -141,106 +166,59 @@ class Level01(DirectObject):
         objects = self.level.findAllMatches('**/Switch')
 
         # Load switch anim
-        switchAnimNode = loader.loadModel("Switch-Activate.egg")
+        switchAnimNode = loader.loadModel("Switch-Activate")
         switchAnim = switchAnimNode.find("+AnimBundleNode").node().getBundle()
 
         self.switchControls = {}
 
-        i = 0
         for object in objects:
             bundle = object.node().getBundle(0)
             control = bundle.bindAnim(switchAnim, ~0)
 
-            switchsphere = CollisionSphere(0, 0, 0, 0.5)
-            switchsphere.setTangible(False)
-            switchColNP = object.getParent().attachNewNode(CollisionNode('switchActivation%d'%i))
-            switchColNP.node().addSolid(switchsphere)
-            self.switchControls.setdefault(object.getParent(), [control, switchColNP])
-            switchName = object.getParent().getParent().getName()
-            self.accept("playerCollision-in-switchActivation%d"%i,
-                        self.__setActivateElement,
-                        extraArgs=[True, switchName, "switch"])
-            self.accept("playerCollision-out-switchActivation%d"%i,
-                        self.__setActivateElement,
-                        extraArgs=[False, switchName, "switch"])
-            i+=1
+            self.switchControls.setdefault(object.getParent(), [control])
+            self.roomCuller.addNode(object.getParent().getParent())
 
         for key, value in self.switchControls.iteritems():
             value[0].pose(0)
 
     def initSwitchSigns(self):
-        self.switchSigns = []
-        for i in range(11):
-            cm = CardMaker('card%d'%i)
-            cm.setColor(0,0,0,0)
-            cm.setFrame(-0.5, 0.5, -0.5, 0.5)
-            card = self.level.attachNewNode(cm.generate())
-            card.setAttrib(TransparencyAttrib.make(TransparencyAttrib.M_alpha))
-            tex = loader.loadTexture('%d.png'%i)
-            ts = TextureStage('ts')
-            ts.setMode(TextureStage.MReplace)
-            card.setTexture(ts, tex)
-            card.setEffect(BillboardEffect.makePointEye())
-            card.hide()
-            self.switchSigns.append(card)
+        # one billboard card above each of the four puzzle switches, all
+        # drawn from the digits atlas in one geom
+        self.switchSigns = CardBatch(getAtlas("digits"), "switchSigns", 4, billboard=True)
+        self.switchSigns.nodePath.reparentTo(self.level)
 
     def initPostsigns(self):
         objects = self.level.findAllMatches('**/Signpost.*')
 
-        self.postsigns = {}
+        self.postsigns = []
 
-        i = 0
         for object in objects:
-            postsphere = CollisionSphere(0, 0, 0.5, 1)
-            postsphere.setTangible(False)
-            postColNP = object.attachNewNode(CollisionNode('postsignInfo%d'%i))
-            postColNP.node().addSolid(postsphere)
-            self.postsigns.setdefault(object, postColNP)
-            postName = object.getName()
-            self.accept("playerCollision-in-postsignInfo%d"%i,
-                        self.__setActivateElement,
-                        extraArgs=[True, postName, "postsign"])
-            self.accept("playerCollision-out-postsignInfo%d"%i,
-                        self.__setActivateElement,
-                        extraArgs=[False, postName, "postsign"])
-            i+=1
+            self.postsigns.append(object)
+            self.roomCuller.addNode(object)
 
     def initChests(self):
         objects = self.level.findAllMatches('**/Box_long_looseLid')
 
-        boxAnimNode = loader.loadModel("Box_long_looseLid-open.egg")
+        boxAnimNode = loader.loadModel("Box_long_looseLid-open")
         boxAnim = boxAnimNode.find("+AnimBundleNode").node().getBundle()
 
         self.boxControls = {}
 
-        i = 0
         for object in objects:
             bundle = object.node().getBundle(0)
             control = bundle.bindAnim(boxAnim, ~0)
 
-            boxsphere = CollisionSphere(0, 0, 0, 1.0)
-            boxsphere.setTangible(False)
-            boxColNP = object.getParent().attachNewNode(CollisionNode('boxActivation%d'%i))
-            boxColNP.node().addSolid(boxsphere)
-            #boxColNP.show()
-            self.boxControls.setdefault(object.getParent(), [control, boxColNP])
-            boxName = object.getParent().getParent().getName()
-            self.accept("playerCollision-in-boxActivation%d"%i,
-                        self.__setActivateElement,
-                        extraArgs=[True, boxName, "box"])
-            self.accept("playerCollision-out-boxActivation%d"%i,
-                        self.__setActivateElement,
-                        extraArgs=[False, boxName, "box"])
-            i+=1
+            self.boxControls.setdefault(object.getParent(), [control])
+            self.roomCuller.addNode(object.getParent().getParent())
 
     def initDoors(self):
         objects = self.level.findAllMatches('**/*Door*Armature')
         colliders = self.level.findAllMatches('**/*Door*collision')
 
-        bdoorAnimNode = loader.loadModel("Boulder_Door-open.egg")
+        bdoorAnimNode = loader.loadModel("Boulder_Door-open")
         bdoorAnim = bdoorAnimNode.find("+AnimBundleNode").node().getBundle()
 
-        wdoorAnimNode = loader.loadModel("Wood_Door_Basic-open.egg")
+        wdoorAnimNode = loader.loadModel("Wood_Door_Basic-open")
         wdoorAnim = wdoorAnimNode.find("+AnimBundleNode").node().getBundle()
 
         self.doorControls = {}
@@ -260,46 +238,39 @@ class Level01(DirectObject):
             elif "Wood" in collider.getName():
                 self.doorControls[collider.getParent()].append(collider)
 
+        # remember the collide masks of the door colliders, opened doors will
+        # get their mask cleared and need it back if the level is reset
+        self.doorMasks = {}
         for key, value in self.doorControls.iteritems():
             value[0].pose(0)
+            door = key.getParent()
+            self.roomCuller.addPortal(door.getName(), door.getY(self.level))
+            if len(value) > 1:
+                self.doorMasks[key] = value[1].node().getIntoCollideMask()
 
     def initKeyDoors(self):
-        i = 0
+        self.keyDoors = []
         for keyDoor in self.KeyDoorLogic:
             for door, value in self.doorControls.iteritems():
                 if keyDoor == door.getParent().getName():
-                    c = Point3(0,0,0)
-                    p1 = Point3(c.getX()-1, c.getY()-0.8, c.getZ())
-                    p2 = Point3(c.getX()+1, c.getY()+0.8, c.getZ()+2)
-                    keyDoorBox = CollisionBox(p1, p2)
-                    keyDoorBox.setTangible(False)
-                    keyDoorColNP = door.getParent().attachNewNode(CollisionNode('keyDoorActivation%d'%i))
-                    keyDoorColNP.node().addSolid(keyDoorBox)
-                    keyDoorName = door.getParent().getName()
-                    self.accept("playerCollision-in-keyDoorActivation%d"%i,
-                                self.__setActivateElement,
-                                extraArgs=[True, keyDoorName, "door"])
-                    self.accept("playerCollision-out-keyDoorActivation%d"%i,
-                                self.__setActivateElement,
-                                extraArgs=[False, keyDoorName, "door"])
-                    i+=1
+                    self.keyDoors.append(door.getParent())
 
     def initHearts(self):
         heartPositions = self.level.findAllMatches('**/*Heart*')
         self.hearts = []
+        self.heartPositions = []
+        # all hearts are instances of one rotating model
+        heartModel = loader.loadModel("Heart")
+        self.heartSpinner = NodePath("heartSpinner")
+        heartModel.reparentTo(self.heartSpinner)
+        self.heartRotation = self.heartSpinner.hprInterval(2.0, Vec3(360, 0, 0))
+        self.heartRotation.loop()
         i = 0
         for pos in heartPositions:
-            heart = loader.loadModel("Heart")
-            heart.reparentTo(pos)
-            heartRotation = heart.hprInterval(2.0, Vec3(360, 0, 0))
-            heartRotation.loop()
-            heartsphere = CollisionSphere(0, 0, 0, 0.5)
-            heartsphere.setTangible(False)
-            heartColNP = heart.attachNewNode(CollisionNode('heart%d'%i))
-            heartColNP.node().addSolid(heartsphere)
-            self.accept("playerCollision-in-heart%d"%i,
-                        self.__collectHeart,
-                        extraArgs=[i])
+            heart = pos.attachNewNode("heart%d"%i)
+            self.heartSpinner.instanceTo(heart)
+            self.heartPositions.append(pos)
+            self.roomCuller.addNode(pos)
             self.hearts.append(heart)
             i+=1
 
@@ -310,17 +281,59 @@ class Level01(DirectObject):
         self.artifact.reparentTo(render)
         self.artifact.hide()
         self.initLights()
-
+        self.roomCuller.addViewer(base.camera)
+        self.roomCuller.start()
+        self.lightAssigner.start()
+        self.particleLOD.start()
+        self.initTriggers()
+
+        self.setupPuzzle()
+
+    def initTriggers(self):
+        """Register the trigger volumes of the interactive objects, they are
+        global and will only be removed again when the level is stopped"""
+        for switch in self.switchControls.keys():
+            self.triggers.append(base.triggers.addSphere(
+                switch, (0, 0, 0), 0.5,
+                self.__setActivateElement, [switch.getParent().getName(), "switch"]))
+        for post in self.postsigns:
+            self.triggers.append(base.triggers.addSphere(
+                post, (0, 0, 0.5), 1,
+                self.__setActivateElement, [post.getName(), "postsign"]))
+        for box in self.boxControls.keys():
+            self.triggers.append(base.triggers.addSphere(
+                box, (0, 0, 0), 1.0,
+                self.__setActivateElement, [box.getParent().getName(), "box"]))
+        for door in self.keyDoors:
+            p1 = Point3(-1, -0.8, 0)
+            p2 = Point3(1, 0.8, 2)
+            self.triggers.append(base.triggers.addBox(
+                door, p1, p2,
+                self.__setActivateElement, [door.getName(), "door"]))
+        self.heartTriggers = []
+        for i in range(len(self.heartPositions)):
+            heartTrigger = base.triggers.addSphere(
+                self.heartPositions[i], (0, 0, 0), 0.5, self.__collectHeart, [i])
+            self.triggers.append(heartTrigger)
+            self.heartTriggers.append(heartTrigger)
+        # everything below the deathplane kills the player
+        self.triggers.append(base.triggers.addPlane(
+            render, Plane((0, 0, 1), (0, 0, -1)), self.__fallenDown))
+
+    def setupPuzzle(self):
+        """Choose a random switch order for the logic puzzle and set up the
+        signs and sign texts that belong to it"""
         #
         # SETUP THE LOGIC PUZZLE IN ROOM 2
         #
         # get a random order
-        self.order1 = random.choice(self.switchOrders)
+        # NOTE: copy the order, as the sign numbers will be appended to it
+        self.order1 = list(random.choice(self.switchOrders))
         # set the switch order
         switchlist = []
         for item in self.order1[1]:
             switchlist.append("Switch.00%d"%item)
-        self.switchOrderLogic.setdefault("ORDER1", switchlist)
+        self.switchOrderLogic["ORDER1"] = switchlist
         # randomly assign numbers between 0 and 10 to the switches
         signlist = []
         for i in range(4):
@@ -342,14 +355,14 @@ class Level01(DirectObject):
         # Now we should have random numbers between 0 and 10 in the same order
         # as the order1 list needs
         # Finally add the signs above the switches
+        self.switchSigns.hideAll()
         for i in range(4):
             for switch, value in self.switchControls.iteritems():
                 if self.switchOrderLogic.get("ORDER1")[i] in switch.getParent().getName():
                     print "append", signlist[i], "to", self.switchOrderLogic.get("ORDER1")[i]
-                    pos = switch.getPos(render)
+                    pos = switch.getPos(self.level)
                     pos.setZ(pos.getZ() + 1.0)
-                    self.switchSigns[signlist[i]].setPos(pos)
-                    self.switchSigns[signlist[i]].show()
+                    self.switchSigns.setCard(i, "%d.png" % signlist[i], pos)
 
         #
         # SETUP THE SIGN TEXTS
@@ -362,11 +375,57 @@ class Level01(DirectObject):
             "Signpost.004":_("In the next chamber a ferocious enemy will await you defending the artifact. Defeate him and show that you'll be able to defend your people.\n\nTo attack use the action key."),
             "Signpost.005":_("Finally you made it all the way through path of the kings. Open the chest, take the artifact and you'll be ready for becomming the next king.")}
 
+    def reset(self):
+        """Bring the started level back to its initial state without
+        reloading it, so a new game can be started right away"""
+        for key, value in self.switchControls.iteritems():
+            value[0].stop()
+            value[0].pose(0)
+        for key, value in self.boxControls.iteritems():
+            value[0].stop()
+            value[0].pose(0)
+        for key, value in self.doorControls.iteritems():
+            value[0].stop()
+            value[0].pose(0)
+            if len(value) > 1:
+                value[1].node().setIntoCollideMask(self.doorMasks[key])
+        if self.chestAnimation is not None:
+            self.chestAnimation.pause()
+            self.chestAnimation = None
+        self.key.hide()
+        self.artifact.hide()
+        for i in range(len(self.hearts)):
+            self.__respawnHeart(i)
+        self.activeSwitch = None
+        self.activePostsign = None
+        self.activeBox = None
+        self.activeDoor = None
+        self.numKeys = 0
+        self.roomCuller.closeAllPortals()
+        self.setupPuzzle()
+
     def stop(self):
+        self.roomCuller.stop()
+        self.lightAssigner.stop()
+        self.particleLOD.stop()
+        self.heartRotation.pause()
+        self.switchSigns.removeNode()
+        for trigger in self.triggers:
+            base.triggers.removeTrigger(trigger)
+        self.triggers = []
         render.clearLight()
         self.level.clearLight()
         self.level.removeNode()
 
+    def addViewer(self, nodePath):
+        """Render the rooms which can be seen from the position of the given
+        node too, the camera has been added already"""
+        self.roomCuller.addViewer(nodePath)
+
+    def addMover(self, nodePath):
+        """Let the nearest lights shine on the given moving object"""
+        self.lightAssigner.addMover(nodePath)
+
     def getPlayerStartPoint(self):
         return self.level.find("**/Character")
 
@@ -465,7 +524,7 @@ class Level01(DirectObject):
                     keyRotationInterval = self.key.hprInterval(3.0, Vec3(self.key.getH() + 360*2, 0, 0))
                     keyAnimation = Parallel(keyRisingInterval, keyRotationInterval, name="keyAnimation")
                     boxAnimation = AnimControlInterval(value[0])
-                    chestFullAnimation = Sequence(
+                    self.chestAnimation = Sequence(
                         boxAnimation,
                         keyAnimation,
                         Wait(0.25),
@@ -486,13 +545,13 @@ class Level01(DirectObject):
                         artifactRotationInterval,
                         name="artifactAnimation")
                     boxAnimation = AnimControlInterval(value[0])
-                    chestFullAnimation = Sequence(
+                    self.chestAnimation = Sequence(
                         boxAnimation,
                         artifactAnimation,
                         Wait(0.25),
                         Func(self.artifact.hide),
                         Func(self.getArtifact))
-                chestFullAnimation.start()
+                self.chestAnimation.start()
 
     def __activateKeyDoor(self):
         if self.numKeys > 0:
@@ -500,11 +559,22 @@ class Level01(DirectObject):
             self.numKeys -= 1
         base.messenger.send("updateKeyCount", [self.numKeys])
 
-    def __collectHeart(self, index, extraArgs):
-        heart = self.hearts[index]
-        heart.removeNode()
+    def __fallenDown(self, inside):
+        if inside:
+            base.messenger.send("player-die")
+
+    def __collectHeart(self, inside, index):
+        if not inside: return
+        # keep the heart, so it can be respawned if the level is reset
+        self.hearts[index].detachNode()
+        base.triggers.setEnabled(self.heartTriggers[index], False)
         base.messenger.send("player-heal")
 
+    def __respawnHeart(self, index):
+        if self.hearts[index].getParent() == self.heartPositions[index]: return
+        self.hearts[index].reparentTo(self.heartPositions[index])
+        base.triggers.setEnabled(self.heartTriggers[index], True)
+
     def addKey(self):
         self.numKeys += 1
         base.messenger.send("updateKeyCount", [self.numKeys])
@@ -512,7 +582,7 @@ class Level01(DirectObject):
     def getArtifact(self):
         base.messenger.send("GameOver", ["win"])
 
-    def __setActivateElement(self, active, element, elementType, CollEntry):
+    def __setActivateElement(self, active, element, elementType):
         if active:
             base.messenger.send("ActionActive")
         else:
@@ -547,5 +617,6 @@ class Level01(DirectObject):
         for key, value in self.doorControls.iteritems():
             if door == key.getParent().getName():
                 base.messenger.send("PuzzleSolved")
+                self.roomCuller.setPortalOpen(door, True)
                 value[0].play()
                 value[1].node().setIntoCollideMask(CollideMask.allOff())
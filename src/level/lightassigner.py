@@ -0,0 +1,132 @@
+"""Assign only the nearest lights to each object of the level instead of
+letting every light shine on everything. Static objects get their lights
+once, moving objects are re-evaluated whenever they have moved a bit."""
+from panda3d.core import (
+    ConfigVariableBool,
+    ConfigVariableInt,
+    Point3)
+
+
+class LightAssigner():
+    # the distance a moving object has to travel before its lights will be
+    # chosen again
+    MOVEDISTANCE = 1.0
+
+    def __init__(self):
+        self.enabled = ConfigVariableBool("light-assignment", True).getValue()
+        self.maxLights = ConfigVariableInt("max-lights-per-object", 4).getValue()
+        self.lights = []
+        self.inactiveLights = set()
+        # dicts of the assigned lights by their object
+        self.statics = {}
+        self.movers = {}
+        # the bounds of the static objects, they won't change
+        self.staticBounds = {}
+        # the positions of the moving objects at their last assignment
+        self.moverPositions = {}
+
+    def addLight(self, light):
+        self.lights.append(light)
+        if not self.enabled:
+            render.setLight(light)
+            return
+        self.__reassignAll()
+
+    def addStatic(self, nodePath):
+        """Light the object with the lights nearest to its bounds"""
+        self.statics[nodePath] = []
+        self.staticBounds[nodePath] = nodePath.getTightBounds(render)
+        self.__assign(nodePath, self.statics)
+
+    def addMover(self, nodePath):
+        """Light the moving object with the lights nearest to its position,
+        they will be chosen again as it moves"""
+        self.movers[nodePath] = []
+        self.__assign(nodePath, self.movers)
+
+    def removeMover(self, nodePath):
+        if nodePath not in self.movers: return
+        for light in self.movers.pop(nodePath):
+            nodePath.clearLight(light)
+        self.moverPositions.pop(nodePath, None)
+
+    def setLight(self, light):
+        """Activate the light again, the same call as on a NodePath, so the
+        room culler can switch lights on the assigner too"""
+        if light not in self.inactiveLights: return
+        self.inactiveLights.remove(light)
+        if not self.enabled:
+            render.setLight(light)
+            return
+        self.__reassignAll()
+
+    def clearLight(self, light):
+        """Deactivate the light, it will not be assigned to any object"""
+        if light in self.inactiveLights: return
+        self.inactiveLights.add(light)
+        if not self.enabled:
+            render.clearLight(light)
+            return
+        self.__reassignAll()
+
+    def setMaxLights(self, maxLights):
+        """Change the number of lights per object and assign them again"""
+        if maxLights == self.maxLights: return
+        self.maxLights = maxLights
+        self.__reassignAll()
+
+    def start(self):
+        if not self.enabled: return
+        taskMgr.add(self.update, "lightAssignerTask", sort=46)
+
+    def stop(self):
+        taskMgr.remove("lightAssignerTask")
+        for nodePath in self.movers.keys():
+            self.removeMover(nodePath)
+
+    def update(self, task):
+        for nodePath in self.movers.keys():
+            if nodePath.isEmpty(): continue
+            lastPos = self.moverPositions.get(nodePath)
+            pos = nodePath.getPos(render)
+            if lastPos is not None and (pos - lastPos).length() < LightAssigner.MOVEDISTANCE:
+                continue
+            self.__assign(nodePath, self.movers)
+        return task.cont
+
+    def __reassignAll(self):
+        for nodePath in self.statics.keys():
+            self.__assign(nodePath, self.statics)
+        for nodePath in self.movers.keys():
+            self.__assign(nodePath, self.movers)
+
+    def __getDistance(self, light, nodePath, bounds):
+        """Return the distance of the light to the given bounds, it is zero
+        for lights within the bounds"""
+        pos = light.getPos(render)
+        if bounds is None:
+            return (pos - nodePath.getPos(render)).length()
+        minPoint, maxPoint = bounds
+        nearest = Point3(
+            min(max(pos.getX(), minPoint.getX()), maxPoint.getX()),
+            min(max(pos.getY(), minPoint.getY()), maxPoint.getY()),
+            min(max(pos.getZ(), minPoint.getZ()), maxPoint.getZ()))
+        return (pos - nearest).length()
+
+    def __assign(self, nodePath, assignments):
+        if not self.enabled or nodePath.isEmpty(): return
+        bounds = self.staticBounds.get(nodePath)
+        if assignments is self.movers:
+            self.moverPositions[nodePath] = nodePath.getPos(render)
+        lights = [
+            light for light in self.lights
+            if light not in self.inactiveLights]
+        lights.sort(key=lambda light: self.__getDistance(light, nodePath, bounds))
+        lights = lights[:self.maxLights]
+        for light in assignments[nodePath]:
+            if light not in lights:
+                nodePath.clearLight(light)
+        for light in lights:
+            if light not in assignments[nodePath]:
+                nodePath.setLight(light)
+        assignments[nodePath] = lights
@@ -0,0 +1,142 @@
+"""Particle effects with a level of detail by their distance to the camera.
+The .ptf effect files are parsed only once and every effect created from them
+runs the parsed configuration. Effects which are out of view or too far away
+will be paused, the others emit fewer particles the farther away they are."""
+import logging
+import panda3d.core
+import panda3d.physics
+from panda3d.core import (
+    BoundingSphere,
+    ConfigVariableDouble,
+    Filename,
+    VirtualFileSystem)
+from direct.particles import Particles
+from direct.particles import ForceGroup
+from direct.particles.ParticleEffect import ParticleEffect
+
+# the compiled .ptf files by their filename
+templates = {}
+# the names the .ptf files use
+namespace = {}
+
+
+def getTemplate(filename):
+    """Return the compiled code of the given .ptf file, it will only be read
+    and parsed the first time"""
+    if filename in templates:
+        return templates[filename]
+    if not namespace:
+        namespace.update(vars(panda3d.core))
+        namespace.update(vars(panda3d.physics))
+        namespace["Particles"] = Particles
+        namespace["ForceGroup"] = ForceGroup
+    vfs = VirtualFileSystem.getGlobalPtr()
+    data = vfs.readFile(Filename(filename), True)
+    if not data:
+        logging.error("could not read particle effect %s" % filename)
+        templates[filename] = None
+        return None
+    templates[filename] = compile(data.replace("\r", ""), filename, "exec")
+    return templates[filename]
+
+
+def createEffect(filename):
+    """Create a new particle effect configured by the given .ptf file"""
+    effect = ParticleEffect()
+    code = getTemplate(filename)
+    if code is not None:
+        exec code in namespace, {"self": effect}
+    return effect
+
+
+class ParticleLOD():
+    # time in seconds between the level of detail updates
+    UPDATEINTERVAL = 0.1
+    # the fraction of the particles which will be emitted at the far distance
+    MINFACTOR = 0.25
+    # the number of steps between full and minimal particle count
+    STEPS = 3
+
+    def __init__(self):
+        self.maxDistance = ConfigVariableDouble("particle-lod-distance", 20.0).getValue()
+        self.farDistance = self.maxDistance
+        # scales the distance and the number of particles
+        self.density = 1.0
+        # the data of each effect by the effect
+        self.effects = {}
+
+    def addEffect(self, effect):
+        """Control the level of detail of the started effect"""
+        litterSizes = {}
+        for particles in effect.getParticlesList():
+            litterSizes[particles] = particles.getLitterSize()
+        self.effects[effect] = {
+            "parent": effect.getParent(),
+            "litterSizes": litterSizes,
+            # disallowed effects will stay paused, like those of hidden rooms
+            "allowed": True,
+            "running": True,
+            "step": 0}
+
+    def enableEffect(self, effect):
+        if effect in self.effects:
+            self.effects[effect]["allowed"] = True
+
+    def disableEffect(self, effect):
+        if effect not in self.effects: return
+        self.effects[effect]["allowed"] = False
+        self.__setRunning(effect, False)
+
+    def setDensity(self, density):
+        """Scale the particle counts and the distance effects will be shown
+        up to, one is the full density"""
+        self.density = density
+        self.farDistance = self.maxDistance * density
+        for data in self.effects.values():
+            data["step"] = None
+
+    def start(self):
+        taskMgr.doMethodLater(
+            ParticleLOD.UPDATEINTERVAL, self.update, "particleLODTask")
+
+    def stop(self):
+        """Stop the updates and remove all effects"""
+        taskMgr.remove("particleLODTask")
+        for effect in self.effects.keys():
+            effect.cleanup()
+        self.effects = {}
+
+    def __setRunning(self, effect, running):
+        data = self.effects[effect]
+        if data["running"] == running: return
+        data["running"] = running
+        if running:
+            # disabling detaches the effect, so it has to be started again
+            effect.start(data["parent"])
+        else:
+            effect.disable()
+
+    def __setStep(self, effect, step):
+        data = self.effects[effect]
+        if data["step"] == step: return
+        data["step"] = step
+        factor = 1.0 - (1.0 - ParticleLOD.MINFACTOR) * step / ParticleLOD.STEPS
+        factor *= self.density
+        for particles, litterSize in data["litterSizes"].iteritems():
+            particles.setLitterSize(max(1, int(litterSize * factor)))
+
+    def update(self, task):
+        lensBounds = base.camLens.makeBounds()
+        for effect, data in self.effects.iteritems():
+            if not data["allowed"]: continue
+            # paused effects are detached, so use the position in their parent
+            pos = base.cam.getRelativePoint(data["parent"], effect.getPos())
+            distance = pos.length()
+            inView = lensBounds.contains(BoundingSphere(pos, 1.0))
+            if distance > self.farDistance or not inView:
+                self.__setRunning(effect, False)
+                continue
+            self.__setRunning(effect, True)
+            step = int(ParticleLOD.STEPS * distance / self.farDistance + 0.5)
+            self.__setStep(effect, min(step, ParticleLOD.STEPS))
+        return task.again
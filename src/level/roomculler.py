@@ -0,0 +1,147 @@
+"""Room and portal visibility for levels made of a chain of rooms along the Y
+axis. The cooked level has one cell node per room, the doors between them
+act as portals. Only the rooms which can be seen from the room of the camera
+through open doors will be rendered, together with their lights and
+particle effects."""
+import logging
+from bisect import bisect_left
+from panda3d.core import ConfigVariableBool
+
+
+class Room():
+    def __init__(self, index, cell=None):
+        self.index = index
+        # the cell node holding the static geometry of the room
+        self.cell = cell
+        self.nodes = []
+        # lists of (light, receiving node) tuples
+        self.lights = []
+        # lists of (particle effect, controller) tuples
+        self.effects = []
+        self.visible = True
+
+    def setVisible(self, visible):
+        if self.visible == visible: return
+        self.visible = visible
+        for np in self.nodes:
+            if visible:
+                np.show()
+            else:
+                np.hide()
+        for light, receiver in self.lights:
+            if visible:
+                receiver.setLight(light)
+            else:
+                receiver.clearLight(light)
+        for effect, controller in self.effects:
+            if visible:
+                controller.enableEffect(effect)
+            else:
+                controller.disableEffect(effect)
+
+
+class RoomCuller():
+    def __init__(self, level):
+        """level - the NodePath of the level model with its cell nodes"""
+        self.enabled = ConfigVariableBool("room-culling", True).getValue()
+        self.rooms = []
+        self.boundaries = []
+        # the open state of the portal at each boundary
+        self.portals = []
+        self.portalNames = {}
+        self.viewers = []
+        self.visibleRooms = None
+        cells = level.findAllMatches("**/cell.*")
+        if cells.isEmpty():
+            logging.info("no room cells found, room culling disabled")
+            self.enabled = False
+        cells = sorted(cells, key=lambda cell: int(cell.getName().split(".")[1]))
+        for cell in cells:
+            if cell.getTag("maxY") != "inf":
+                self.boundaries.append(float(cell.getTag("maxY")))
+            room = Room(len(self.rooms), cell)
+            room.nodes.append(cell)
+            self.rooms.append(room)
+        self.portals = [False] * len(self.boundaries)
+
+    def getRoomIndex(self, y):
+        return bisect_left(self.boundaries, y)
+
+    def getRoom(self, nodePath):
+        if not self.rooms: return None
+        return self.rooms[self.getRoomIndex(nodePath.getY(render))]
+
+    def addPortal(self, name, y):
+        """Connect the door with the given name to the room boundary closest
+        to the given Y position"""
+        if not self.boundaries: return
+        distances = [abs(boundary - y) for boundary in self.boundaries]
+        self.portalNames[name] = distances.index(min(distances))
+
+    def setPortalOpen(self, name, isOpen):
+        if name not in self.portalNames: return
+        self.portals[self.portalNames[name]] = isOpen
+        self.visibleRooms = None
+
+    def closeAllPortals(self):
+        self.portals = [False] * len(self.boundaries)
+        self.visibleRooms = None
+
+    def addNode(self, nodePath):
+        """Hide and show the given node with the room it is placed in"""
+        room = self.getRoom(nodePath)
+        if room is not None: room.nodes.append(nodePath)
+
+    def addLight(self, light, receiver):
+        """Only let the light shine on the receiving node while the room it
+        is placed in can be seen"""
+        room = self.getRoom(light)
+        if room is not None: room.lights.append((light, receiver))
+
+    def addEffect(self, effect, controller):
+        """Only allow the particle effect to run while the room it is placed
+        in can be seen, the controller which runs the effect gets notified
+        by its enableEffect and disableEffect methods"""
+        room = self.getRoom(effect)
+        if room is not None: room.effects.append((effect, controller))
+
+    def addViewer(self, nodePath):
+        """The rooms which can be seen from the room of every viewer will be
+        rendered, usually those are the camera and the player"""
+        self.viewers.append(nodePath)
+        self.visibleRooms = None
+
+    def start(self):
+        if not self.enabled: return
+        self.visibleRooms = None
+        taskMgr.add(self.update, "roomCullerTask", sort=45)
+
+    def stop(self):
+        taskMgr.remove("roomCullerTask")
+        self.viewers = []
+
+    def getVisibleRooms(self, index):
+        """Return the indices of all rooms which can be seen from the room
+        with the given index, looking through the open portals"""
+        visible = set([index])
+        i = index
+        while i > 0 and self.portals[i - 1]:
+            i -= 1
+            visible.add(i)
+        i = index
+        while i < len(self.portals) and self.portals[i]:
+            i += 1
+            visible.add(i)
+        return visible
+
+    def update(self, task):
+        visibleRooms = set()
+        for viewer in self.viewers:
+            if viewer.isEmpty(): continue
+            visibleRooms |= self.getVisibleRooms(
+                self.getRoomIndex(viewer.getY(render)))
+        if visibleRooms == self.visibleRooms: return task.cont
+        self.visibleRooms = visibleRooms
+        for room in self.rooms:
+            room.setVisible(room.index in visibleRooms)
+        return task.cont
@@ -2,6 +2,9 @@
 # -*- coding: utf-8 -*-
 
 # Python imports
+import time
+# taken as early as possible to measure the startup phases
+startupTime = time.time()
 import __builtin__
 import os
 import atexit
@@ -17,7 +20,6 @@ from panda3d.core import (
     NodePath,
     AudioSound,
     CollisionTraverser,
-    CollisionHandlerPusher,
     WindowProperties,
     MultiplexStream,
     Notify,
@@ -36,6 +38,9 @@ from direct.interval.FunctionInterval import (
     Wait,
     Func)
 from direct.interval.LerpInterval import LerpColorScaleInterval
+from startuptimer import StartupTimer
+startupTimer = StartupTimer(startupTime)
+startupTimer.mark("imports")
 
 
 #
@@ -53,12 +58,6 @@ prcFile = os.path.join(__builtin__.basedir, "%s.prc"%__builtin__.appName)
 if os.path.exists(prcFile):
     loadPrcFile(Filename.fromOsSpecific(prcFile))
 __builtin__.rootdir = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
-vfs = VirtualFileSystem.getGlobalPtr()
-vfs.mount(
-    Filename(os.path.join(__builtin__.rootdir,"assets")),
-    ".",
-    VirtualFileSystem.MFReadOnly
-)
 gettext.bindtextdomain(__builtin__.appName, "localedir")
 gettext.textdomain(__builtin__.appName)
 __builtin__._ = gettext.lgettext
@@ -68,24 +67,14 @@ loadPrcFileData("",
     window-title GrimFang OWP - Ajaw
     cursor-hidden 0
     #show-frame-rate-meter 1
-    model-path $MAIN_DIR/../assets/
     icon-filename = %s
 """%Filename(windowicon))
-#
-# check gamepad support
-#
-__builtin__.gamepadSupport = False
-try:
-    # Pygame for gamepad support
-    import pygame
-    pygame.init()
-    __builtin__.gamepadSupport = True
-    logging.info("gamepads support enabled")
-except:
-    logging.info("gamepads support disabled")
+# gamepad support will be checked when the player needs it the first time
+__builtin__.gamepadSupport = None
 #
 # PATHS AND CONFIGS END
 #
+startupTimer.mark("config")
 
 #
 # LOGGING
@@ -106,15 +95,93 @@ nout.addFile(Filename(os.path.join(__builtin__.basedir, "game_p3d.log")))
 #
 # LOGGING END
 #
+startupTimer.mark("logging")
 
-from world import World
-from gui.mainmenu import Menu
-from gui.optionsmenu import OptionsMenu
+#
+# ASSETS
+#
+vfs = VirtualFileSystem.getGlobalPtr()
+cookDir = os.path.join(__builtin__.basedir, "cooked")
+archive = os.path.join(__builtin__.rootdir, "assets.mf")
+textureQuality = ConfigVariableString("texture-quality", "full").getValue()
+if os.path.exists(archive) and ConfigVariableBool("use-asset-archive", True).getValue():
+    # the packed and already cooked assets, created by "cook.py --archive".
+    # Only one file has to be opened instead of one per asset.
+    vfs.mount(
+        Filename.fromOsSpecific(archive),
+        ".",
+        VirtualFileSystem.MFReadOnly
+    )
+    # the textures of the selected quality tier, lower tiers need less
+    # texture memory on slow machines
+    tierArchive = os.path.join(
+        __builtin__.rootdir, "textures-%s.mf" % textureQuality)
+    if not os.path.exists(tierArchive):
+        logging.warning("unknown texture quality %s" % textureQuality)
+        tierArchive = os.path.join(__builtin__.rootdir, "textures-full.mf")
+    vfs.mount(
+        Filename.fromOsSpecific(tierArchive),
+        ".",
+        VirtualFileSystem.MFReadOnly
+    )
+    loadPrcFileData("", "default-model-extension .bam")
+    logging.info("using asset archive %s" % archive)
+else:
+    # development fallback, use the loose files of the assets folder
+    vfs.mount(
+        Filename(os.path.join(__builtin__.rootdir,"assets")),
+        ".",
+        VirtualFileSystem.MFReadOnly
+    )
+    loadPrcFileData("", "model-path $MAIN_DIR/../assets/")
+    # the cooked bam and txo files will be used instead of the slow to parse
+    # egg files and png images. Stale files will be rebuilt if the sources
+    # have changed
+    if ConfigVariableBool("cook-assets", True).getValue():
+        from cooking.bamcooker import cookModels
+        from cooking.texturecooker import cookTextures
+        try:
+            assetDir = os.path.join(__builtin__.rootdir, "assets")
+            numTextures, cookedTextures = cookTextures(assetDir, cookDir)
+            numModels = cookModels(assetDir, cookDir, cookedTextures)
+            logging.info("cooked %d textures and %d models" % (numTextures, numModels))
+        except Exception, e:
+            logging.error("cooking assets failed: %s" % e)
+    if os.path.exists(os.path.join(cookDir, "models.json")):
+        # the cooked files are mounted after the assets folder, so they will
+        # take precedence over the original files
+        vfs.mount(
+            Filename.fromOsSpecific(cookDir),
+            ".",
+            VirtualFileSystem.MFReadOnly
+        )
+        tierDir = os.path.join(cookDir, "textures", textureQuality)
+        if not os.path.exists(tierDir):
+            logging.warning("unknown texture quality %s" % textureQuality)
+            tierDir = os.path.join(cookDir, "textures", "full")
+        vfs.mount(
+            Filename.fromOsSpecific(tierDir),
+            ".",
+            VirtualFileSystem.MFReadOnly
+        )
+        loadPrcFileData("", "default-model-extension .bam")
+#
+# ASSETS END
+#
+startupTimer.mark("assets")
+
+# NOTE: the world, the menus and all the gameplay modules will be imported
+#       and created when they are needed the first time
+from actorpool import ActorPool
+from prefetch import Prefetcher
+from triggersystem import TriggerSystem
+from simulation import Simulation
 import helper
 
 class Main(ShowBase, FSM):
     def __init__(self):
         ShowBase.__init__(self)
+        startupTimer.mark("showbase")
         FSM.__init__(self, "FSM-Game")
 
         #
@@ -138,6 +205,7 @@ class Main(ShowBase, FSM):
         base.textWriteSpeed = ConfigVariableDouble("text-write-speed",0.05).getValue()
         base.controlType = ConfigVariableString("control-type", "Gamepad").getValue()
         base.mouseSensitivity = ConfigVariableDouble("mouse-sensitivity",1.0).getValue()
+        base.textureQuality = ConfigVariableString("texture-quality", "full").getValue()
         if not os.path.exists(prcFile):
             self.__writeConfig()
             # set window properties
@@ -161,12 +229,25 @@ class Main(ShowBase, FSM):
 
         # enable collision handling
         base.cTrav = CollisionTraverser("base collision traverser")
-        base.pusher = CollisionHandlerPusher()
-        base.pusher.addInPattern('%fn-in-%in')
-        base.pusher.addOutPattern('%fn-out-%in')
-
-        self.menu = Menu()
-        self.options = OptionsMenu()
+        # movement, AI and collisions are stepped with a fixed tick rate
+        base.simulation = Simulation()
+        base.simulation.start()
+        # the trigger volumes of the interactive objects
+        base.triggers = TriggerSystem()
+        base.triggers.start()
+
+        # the player and enemy actors will be kept between the game sessions
+        self.actorPool = ActorPool()
+        # loads the world assets in the background while intro and menu run
+        self.prefetcher = Prefetcher(self.actorPool)
+
+        self.menu = None
+        self.options = None
+        if not ConfigVariableBool("lazy-startup", True).getValue():
+            # create everything right on startup
+            self.getMenu()
+            self.getOptions()
+            import world
 
         self.musicMenu = loader.loadMusic("MayanJingle6_Menu.ogg")
         self.musicMenu.setLoop(True)
@@ -217,6 +298,33 @@ class Main(ShowBase, FSM):
         self.acceptAll()
 
         self.request("Intro")
+        startupTimer.mark("main init")
+        # the report will be written after the first frame has been rendered
+        # which is done by the igLoop task with sort 50
+        taskMgr.add(self.__reportStartup, "reportStartup", sort=55)
+
+    def __reportStartup(self, task):
+        startupTimer.mark("first frame")
+        startupTimer.report()
+        return task.done
+
+    def getMenu(self):
+        """Return the main menu, it will be created on first use"""
+        if self.menu is None:
+            from gui.mainmenu import Menu
+            start = time.time()
+            self.menu = Menu()
+            logging.info("created main menu in %0.1f ms" % ((time.time() - start) * 1000.0))
+        return self.menu
+
+    def getOptions(self):
+        """Return the options menu, it will be created on first use"""
+        if self.options is None:
+            from gui.optionsmenu import OptionsMenu
+            start = time.time()
+            self.options = OptionsMenu()
+            logging.info("created options menu in %0.1f ms" % ((time.time() - start) * 1000.0))
+        return self.options
 
     def acceptAll(self):
         self.accept("escape", self.__escape)
@@ -260,6 +368,7 @@ class Main(ShowBase, FSM):
 
     def enterIntro(self):
         helper.hide_cursor()
+        self.prefetcher.start(Prefetcher.STARTDELAY)
         cm = CardMaker("fade")
         cm.setFrameFullscreenQuad()
         self.gfLogo = NodePath(cm.generate())
@@ -325,29 +434,36 @@ class Main(ShowBase, FSM):
         self.fadeInOut.start()
 
     def enterMenu(self):
+        # continue prefetching, after a game the sounds have to be
+        # loaded again for the next one
+        self.prefetcher.start()
         if self.musicMenu.status() == AudioSound.READY:
             self.musicMenu.play()
 
         self.seqMenuFadeIn = Parallel(
-            Func(self.menu.show),
+            Func(self.getMenu().show),
             self.menuCoverFadeInInterval)
         self.seqMenuFadeIn.start()
 
     def exitMenu(self):
-        self.menu.hide()
+        self.getMenu().hide()
 
     def enterOptions(self):
         self.seqOptionsFadeIn = Parallel(
-            Func(self.options.show),
+            Func(self.getOptions().show),
             self.menuCoverFadeInInterval)
         self.seqOptionsFadeIn.start()
 
     def exitOptions(self):
-        self.options.hide()
+        self.getOptions().hide()
 
     def enterStart(self):
-        self.world = World()
-        self.world.start()
+        # the world loader takes over from here
+        self.prefetcher.stop()
+        from world import World
+        self.world = World(self.actorPool, self.prefetcher)
+        # the world will load in the background and start itself when done
+        self.world.load()
 
     def exitStart(self):
         self.world.stop()
@@ -383,7 +499,8 @@ class Main(ShowBase, FSM):
         mouseSens = str(base.mouseSensitivity)
         customConfigVariables = [
             "", "particles-enabled", "text-write-speed", "audio-mute",
-            "audio-volume", "control-type", "mouse-sensitivity"]
+            "audio-volume", "control-type", "mouse-sensitivity",
+            "texture-quality"]
         if os.path.exists(prcFile):
             page = loadPrcFile(Filename.fromOsSpecific(prcFile))
             removeDecls = []
@@ -408,6 +525,8 @@ class Main(ShowBase, FSM):
             # controls
             page.makeDeclaration("control-type", base.controlType)
             page.makeDeclaration("mouse-sensitivity", mouseSens)
+            # graphics
+            page.makeDeclaration("texture-quality", base.textureQuality)
         else:
             cpMgr = ConfigPageManager.getGlobalPtr()
             page = cpMgr.makeExplicitPage("%s Pandaconfig"%appName)
@@ -429,6 +548,8 @@ class Main(ShowBase, FSM):
             # player controls
             page.makeDeclaration("control-type", base.controlType)
             page.makeDeclaration("mouse-sensitivity", mouseSens)
+            # graphics
+            page.makeDeclaration("texture-quality", base.textureQuality)
         # create a stream to the specified config file
         configfile = OFileStream(prcFile)
         # and now write it out
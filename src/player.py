@@ -1,6 +1,8 @@
 import random
 import math
-from direct.actor.Actor import Actor
+import actorlod
+import collidelayers
+from charactercontroller import CharacterController
 from direct.fsm.FSM import FSM
 from direct.showbase.DirectObject import DirectObject
 from direct.interval.ProjectileInterval import ProjectileInterval
@@ -10,17 +12,15 @@ from panda3d.core import (
     NodePath,
     PandaNode,
     CollisionSphere,
-    CollisionRay,
     CollisionSegment,
     CollisionNode,
-    CollisionHandlerFloor,
-    CollisionHandlerEvent,
     CollisionHandlerQueue,
     PointLight)
 from direct.interval.IntervalGlobal import Sequence
 from direct.interval.FunctionInterval import (
     Wait,
     Func)
+import helper
 try:
 	import pygame
 except:
@@ -33,6 +33,20 @@ class Player(FSM, DirectObject):
     GAMEPADMODE = "Gamepad"
     MOUSEANDKEYBOARD = "MouseAndKeyboard"
 
+    animations = {
+        "Idle":"Character-Idle",
+        "Run":"Character-Run",
+        "Activate":"Character-Activate",
+        "Death":"Character-Death",
+        "Jump":"Character-Jump",
+        "Hit":"Character-Hit",
+        "Fight_Attack":"Character-FightAttack",
+        "Fight_Idle":"Character-FightIdle",
+        "Fight_Left":"Character-FightLeft",
+        "Fight_Right":"Character-FightRight"}
+    # all model files the player needs, so they can be preloaded
+    models = ["Character", "Spear", "Shield"] + sorted(animations.values())
+
     def __init__(self):
         FSM.__init__(self, "FSM-Player")
         random.seed()
@@ -40,17 +54,7 @@ class Player(FSM, DirectObject):
         #
         # PLAYER CONTROLS AND CAMERA
         #
-        self.player = Actor("Character", {
-            "Idle":"Character-Idle",
-            "Run":"Character-Run",
-            "Activate":"Character-Activate",
-            "Death":"Character-Death",
-            "Jump":"Character-Jump",
-            "Hit":"Character-Hit",
-            "Fight_Attack":"Character-FightAttack",
-            "Fight_Idle":"Character-FightIdle",
-            "Fight_Left":"Character-FightLeft",
-            "Fight_Right":"Character-FightRight"})
+        self.player = actorlod.loadActor("Character", Player.animations)
         self.player.setBlend(frameBlend = True)
         # the initial cam distance
         self.fightCamDistance = 3.0
@@ -76,12 +80,14 @@ class Player(FSM, DirectObject):
         self.winYhalf = base.win.getYSize() / 2
         # Interval for the jump animation
         self.jumpInterval = None
+        # the time the current jump has been running for
+        self.jumpTime = 0.0
         self.jumpstartFloater = NodePath(PandaNode("jumpstartFloater"))
         self.jumpstartFloater.reparentTo(render)
         self.deathComplete = None
         # Joystick/Gamepad support
         self.hasJoystick = False
-        if gamepadSupport:
+        if helper.initGamepadSupport():
             # initialize controls
             joysticks = [pygame.joystick.Joystick(x) for x in range(pygame.joystick.get_count())]
             if len(joysticks) > 0:
@@ -92,12 +98,13 @@ class Player(FSM, DirectObject):
         #
         # WEAPONS AND ACCESSORIES
         #
-        self.RightHandAttach = self.player.exposeJoint(None, "modelRoot", "HandAttach_R")
+        jointLOD = actorlod.getJointLOD(self.player)
+        self.RightHandAttach = self.player.exposeJoint(None, "modelRoot", "HandAttach_R", jointLOD)
         self.spear = loader.loadModel("Spear")
         self.spear.setP(90)
         self.spear.setR(180)
         self.spear.reparentTo(self.RightHandAttach)
-        self.LeftHandAttach = self.player.exposeJoint(None, "modelRoot", "HandAttach_L")
+        self.LeftHandAttach = self.player.exposeJoint(None, "modelRoot", "HandAttach_L", jointLOD)
         self.shield = loader.loadModel("Shield")
         self.shield.setZ(0.05)
         self.shield.setH(-90)
@@ -109,32 +116,24 @@ class Player(FSM, DirectObject):
         self.playerSphere = CollisionSphere(0, 0, 0.8, 0.7)
         self.playerCollision = self.player.attachNewNode(CollisionNode("playerCollision"))
         self.playerCollision.node().addSolid(self.playerSphere)
-        base.pusher.addCollider(self.playerCollision, self.player)
-        base.cTrav.addCollider(self.playerCollision, base.pusher)
-        # The foot collision checks
-        self.footRay = CollisionRay(0, 0, 0, 0, 0, -1)
-        self.playerFootRay = self.player.attachNewNode(CollisionNode("playerFootCollision"))
-        self.playerFootRay.node().addSolid(self.footRay)
-        self.playerFootRay.node().setIntoCollideMask(0)
-        self.lifter = CollisionHandlerFloor()
-        self.lifter.addCollider(self.playerFootRay, self.player)
-        self.lifter.setMaxVelocity(5)
-        base.cTrav.addCollider(self.playerFootRay, self.lifter)
-        # a collision segment slightly in front of the player to check for jump ledges
-        self.jumpCheckSegment = CollisionSegment(0, -0.2, 0.5, 0, -0.2, -2)
-        self.playerJumpRay = self.player.attachNewNode(CollisionNode("playerJumpCollision"))
-        self.playerJumpRay.node().addSolid(self.jumpCheckSegment)
-        self.playerJumpRay.node().setIntoCollideMask(0)
-        self.jumper = CollisionHandlerEvent()
-        self.jumper.addOutPattern('%fn-out')
-        base.cTrav.addCollider(self.playerJumpRay, self.jumper)
+        # the sphere is only the hitbox for the golems attacks
+        collidelayers.setSolid(self.playerCollision, "playerHitbox")
+        # moves the player along the ground and walls, the ledge probe
+        # slightly in front of the player checks for jump ledges
+        self.controller = CharacterController(
+            self.player, 0.7, 1.8, ["floor", "wall", "enemyHitbox"],
+            ledgeProbe=(Point3(0, -0.2, 0.5), Point3(0, -0.2, -2)),
+            ledgeCallback=self.jump)
         # a collision segment to check attacks
         self.attackCheckSegment = CollisionSegment(0, 0, 1, 0, -1.3, 1)
         self.playerAttackRay = self.player.attachNewNode(CollisionNode("playerAttackCollision"))
         self.playerAttackRay.node().addSolid(self.attackCheckSegment)
-        self.playerAttackRay.node().setIntoCollideMask(0)
+        collidelayers.setCollider(self.playerAttackRay, ["enemyHitbox"])
         self.attackqueue = CollisionHandlerQueue()
-        base.cTrav.addCollider(self.playerAttackRay, self.attackqueue)
+        # the floor heights and ledges of the level, if they have been baked
+        self.heightField = None
+        self.ledgeGraph = None
+        self.atLedge = False
 
         #
         # SOUNDEFFECTS
@@ -153,7 +152,18 @@ class Player(FSM, DirectObject):
         self.player.setPos(startPoint.getPos())
         self.player.setHpr(startPoint.getHpr())
         self.player.reparentTo(render)
+        self.player.show()
         self.jumpstartFloater.setPos(self.player.getPos())
+        # screen sizes, the window may have changed since the last start
+        self.winXhalf = base.win.getXSize() / 2
+        self.winYhalf = base.win.getYSize() / 2
+
+        self.controller.reset()
+        # register the colliders, they will be removed again on stop
+        base.cTrav.addCollider(self.playerAttackRay, self.attackqueue)
+        # the same sphere will be tested against the trigger volumes
+        base.triggers.addTracker(
+            self.player, self.playerSphere.getCenter(), self.playerSphere.getRadius())
 
         self.keyMap = {"horizontal":0, "vertical":0}
 
@@ -201,10 +211,10 @@ class Player(FSM, DirectObject):
             self.acceptOnce(event, self.request, ["Action"])
         self.accept("ActionDone", self.request, ["Idle"])
 
-        self.accept("playerJumpCollision-out", self.jump)
-
-        taskMgr.add(self.move, "task_movement", priority=-10)
-        taskMgr.add(self.updateCam, "task_camActualisation", priority=-4)
+        base.simulation.addStep("playerMove", self.move, sort=10)
+        base.simulation.addInterpolated(self.player)
+        # the camera follows the interpolated player every frame
+        taskMgr.add(self.updateCam, "task_camActualisation", sort=40)
 
         if self.hasJoystick:
             taskMgr.add(self.gamepadLoop, "task_gamepad_loop", priority=-5)
@@ -217,11 +227,32 @@ class Player(FSM, DirectObject):
         self.request("Idle")
 
     def stop(self):
-        taskMgr.remove("task_movement")
+        base.simulation.removeStep("playerMove")
+        base.simulation.removeInterpolated(self.player)
         taskMgr.remove("task_camActualisation")
         taskMgr.remove("task_gamepad_loop")
         self.ignoreAll()
         self.player.hide()
+        base.cTrav.removeCollider(self.playerAttackRay)
+        base.triggers.removeTracker(self.player)
+
+    def reset(self):
+        """Stop the player and bring it back to the state right after it has
+        been created, so it can be started again in a new world"""
+        self.stop()
+        if self.deathComplete is not None:
+            self.deathComplete.pause()
+            self.deathComplete = None
+        if self.jumpInterval is not None:
+            self.jumpInterval.pause()
+            self.jumpInterval = None
+        self.footstep.stop()
+        self.spearAttackSfx.stop()
+        self.controller.reset()
+        self.attackqueue.clearEntries()
+        self.request("Off")
+        self.player.stop()
+        self.player.detachNode()
 
     def cleanup(self):
         self.stop()
@@ -231,6 +262,7 @@ class Player(FSM, DirectObject):
             self.jumpInterval.finish()
         self.spear.removeNode()
         self.shield.removeNode()
+        self.controller.cleanup()
         self.player.cleanup()
         self.player.removeNode()
         self.jumpstartFloater.removeNode()
@@ -257,9 +289,22 @@ class Player(FSM, DirectObject):
         else:
             self.request("Hit")
 
+    def setHeightField(self, heightField):
+        """Use the baked floor heights of the level for the ground and the
+        jump landings"""
+        self.heightField = heightField
+        self.controller.setHeightField(heightField)
+
+    def setLedgeGraph(self, ledgeGraph):
+        """Take the jumps from the baked ledges of the level instead of the
+        ledge probe"""
+        self.ledgeGraph = ledgeGraph
+        self.atLedge = False
+        self.controller.setLedgeProbeActive(ledgeGraph is None)
+
     def resetPlayerPos(self):
         self.player.setPos(self.jumpstartFloater.getPos())
-        self.jumper.clear()
+        self.controller.reset()
         self.request("Idle")
 
     def gameOver(self):
@@ -312,35 +357,52 @@ class Player(FSM, DirectObject):
     def setKey(self, key, value):
         self.keyMap[key] = value
 
-    def move(self, task):
-        dt = globalClock.getDt()
-        resetMouse = False
-
+    def move(self, dt):
+        """Simulation step of the player, dt is the fixed tick length"""
         def resetMouse():
             if base.controlType == Player.MOUSEANDKEYBOARD:
                 base.win.movePointer(0, self.winXhalf, self.winYhalf)
 
+        if self.jumpInterval is not None:
+            # the jump is stepped with the ticks instead of the frame time
+            self.jumpTime += dt
+            if self.jumpTime < self.jumpInterval.getDuration():
+                self.jumpInterval.setT(self.jumpTime)
+                resetMouse()
+                return
+            self.jumpInterval.finish()
+            self.jumpInterval = None
+            self.controller.reset()
+
         if self.player.getAnimControl("Hit").isPlaying() or \
             self.player.getAnimControl("Death").isPlaying():
             resetMouse()
-            return task.cont
-        if self.deathComplete is not None:
-            if self.deathComplete.isPlaying():
-                resetMouse()
-                return task.cont
-        if self.jumpInterval is not None:
-            if self.jumpInterval.isPlaying():
-                resetMouse()
-                return task.cont
-        if self.isActionmove:
+        elif self.deathComplete is not None and self.deathComplete.isPlaying():
             resetMouse()
-            return task.cont
-
-        if self.mode == Player.NormalMode:
+        elif self.isActionmove:
+            resetMouse()
+        elif self.mode == Player.NormalMode:
             self.__normalMove(dt)
         else:
             self.__fightMove(dt)
-        return task.cont
+        # only jump off a ledge when running towards it, not when turning
+        # while standing at it
+        forward = render.getRelativeVector(self.player, Vec3(0, -1, 0))
+        movingForward = self.controller.motion.dot(forward) > 0
+        # the ground, walls and ledges of this tick are resolved together
+        self.controller.update(dt)
+        if self.ledgeGraph is not None:
+            landing = None
+            if self.controller.onGround and movingForward:
+                landing = self.ledgeGraph.findJump(
+                    self.player.getPos(render), forward)
+            if landing is not None and not self.atLedge:
+                self.jump(landing)
+            self.atLedge = landing is not None
+
+    def __moveLocal(self, x, y):
+        """Move the player relative to its own heading"""
+        self.controller.move(render.getRelativeVector(self.player, Vec3(x, y, 0)))
 
     def __normalMove(self, dt):
         requestState = "Idle"
@@ -362,7 +424,7 @@ class Player(FSM, DirectObject):
                 self.player.setH(camera, rotation)
                 self.player.setP(0)
                 self.player.setR(0)
-                self.player.setPos(self.player,(0, -2 * self.speed * dt, 0))
+                self.__moveLocal(0, -2 * self.speed * dt)
         elif base.controlType == Player.MOUSEANDKEYBOARD:
             if not base.mouseWatcherNode.hasMouse(): return
             self.pointer = base.win.getPointer(0)
@@ -380,10 +442,9 @@ class Player(FSM, DirectObject):
                     h = -360
                 self.player.setH(h)
                 if move:
-                    self.player.setPos(self.player,(
+                    self.__moveLocal(
                         2*dt*self.keyMap["horizontal"],
-                        2*dt*self.keyMap["vertical"],
-                        0))
+                        2*dt*self.keyMap["vertical"])
                 self.center()
         if self.state != requestState:
             self.request(requestState)
@@ -395,39 +456,44 @@ class Player(FSM, DirectObject):
         self.player.lookAt(self.trackedEnemy)
         self.player.setH(self.player, 180)
         if self.keyMap["horizontal"] > 0:
-            self.player.setX(self.player, 2 * self.speed * dt)
+            self.__moveLocal(2 * self.speed * dt, 0)
             requestState = "FightLeft"
         elif self.keyMap["horizontal"] < 0:
-            self.player.setX(self.player, -2 * self.speed * dt)
+            self.__moveLocal(-2 * self.speed * dt, 0)
             requestState = "FightRight"
         elif self.keyMap["vertical"] < 0:
-            self.player.setY(self.player, -2 * self.speed * dt)
+            self.__moveLocal(0, -2 * self.speed * dt)
             requestState = "Run"
         elif self.keyMap["vertical"] > 0:
-            self.player.setY(self.player, 2 * self.speed * dt)
+            self.__moveLocal(0, 2 * self.speed * dt)
             requestState = "RunReverse"
         if self.state != requestState:
             self.request(requestState)
         self.setAnimationSpeed(requestState)
 
-    def jump(self, extraArg):
-        intoName = extraArg.getIntoNode().getName().lower()
-        if not "floor" in intoName and not "plate" in intoName: return
+    def jump(self, landing=None):
+        """Jump off the ledge in front of the player, the landing point comes
+        from the baked ledges or will be calculated from the heading"""
         # setup the projectile interval
         startPos = self.player.getPos()
         self.jumpstartFloater.setPos(self.player, 0, 0.5, 0)
-        tempFloater = NodePath(PandaNode("tempJumpFloater"))
-        tempFloater.setPos(self.player, 0, -3.2, 0.1)
-        endPos = tempFloater.getPos()
-        tempFloater.removeNode()
+        if landing is not None:
+            endPos = Point3(landing)
+        else:
+            endPos = render.getRelativePoint(self.player, Point3(0, -3.2, 0.1))
+        if landing is None and self.heightField is not None:
+            # land right on the floor at the end of the jump
+            landingZ = self.heightField.getHeight(endPos.getX(), endPos.getY())
+            if landingZ is not None and landingZ <= startPos.getZ() + 0.1:
+                endPos.setZ(landingZ)
         self.jumpInterval = ProjectileInterval(
             self.player,
             startPos = startPos,
             endPos = endPos,
             duration = 1.5,
             gravityMult = 0.25)
+        self.jumpTime = 0.0
         self.request("Jump")
-        self.jumpInterval.start()
 
     #
     # CAMERA FUNCTIONS
@@ -612,12 +678,10 @@ class Player(FSM, DirectObject):
         attackAnim.setDoneEvent("ActionDone")
         attackAnim.start()
         self.spearAttackSfx.play()
-        for i in range(self.attackqueue.getNumEntries()):
-            entry = self.attackqueue.getEntry(i)
-            into = entry.getIntoNode()
-            if "golemHitField" in into.getName():
-                if random.random() > .15:
-                    base.messenger.send("HitEnemy")
+        # the attack segment only tests the enemy hitboxes
+        if self.attackqueue.getNumEntries() > 0:
+            if random.random() > .15:
+                base.messenger.send("HitEnemy")
         self.footstep.stop()
 
     def enterFightLeft(self):
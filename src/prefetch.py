@@ -0,0 +1,116 @@
+"""Load the assets of the world in the background while the intro and the
+menu are shown, so starting a game doesn't have to wait for them"""
+import logging
+from panda3d.core import AudioSound
+from gui.atlas import getAtlas
+
+
+class Prefetcher():
+    # the async loader priority of the prefetched models, lower than the
+    # default priority of requests made by the world loader
+    PRIORITY = -100
+    # time in seconds to wait before the prefetching starts, to not
+    # disturb the first frames of the intro
+    STARTDELAY = 1.0
+
+    def __init__(self, actorPool):
+        self.actorPool = actorPool
+        self.running = False
+        self.models = []
+        self.atlases = []
+        self.music = []
+        self.sfx = []
+        self.actorClasses = []
+        self.requests = {}
+        self.loadedModels = set()
+        self.builtAtlases = set()
+        self.sounds = {}
+
+    def __collectAssets(self):
+        """Get the lists of assets the world needs, the modules will be
+        imported here to not slow down the application start"""
+        if self.models: return
+        from world import World
+        from level.level01 import Level01
+        from player import Player
+        from golem import Golem
+        from gui.hud import PlayerHUD
+        self.models = Level01.models + Player.models + Golem.models
+        self.atlases = Level01.atlases + PlayerHUD.atlases
+        self.music = World.musicFiles
+        self.sfx = World.sfxFiles
+        self.actorClasses = [Player, Golem]
+
+    def start(self, delay=0):
+        """Start or continue prefetching everything which is not loaded yet"""
+        if self.running: return
+        self.running = True
+        taskMgr.doMethodLater(delay, self.__begin, "prefetchBegin")
+
+    def stop(self):
+        """Stop prefetching, everything that has been loaded so far stays
+        available"""
+        self.running = False
+        taskMgr.remove("prefetchBegin")
+        taskMgr.remove("prefetchTask")
+        for request in self.requests.values():
+            loader.cancelRequest(request)
+        self.requests = {}
+
+    def __begin(self, task):
+        self.__collectAssets()
+        for name in self.models:
+            if name in self.loadedModels or name in self.requests: continue
+            self.requests[name] = loader.loadModel(
+                name,
+                callback=self.__modelDone,
+                extraArgs=[name],
+                priority=Prefetcher.PRIORITY)
+        taskMgr.add(self.__prefetchTask, "prefetchTask", sort=100)
+        return task.done
+
+    def __modelDone(self, model, name):
+        if name in self.requests:
+            del self.requests[name]
+        if model is None:
+            logging.error("could not prefetch %s" % name)
+            return
+        self.loadedModels.add(name)
+
+    def __prefetchTask(self, task):
+        """Build one texture atlas, load one sound or actor per frame, so the
+        intro and menu keep running smoothly"""
+        for name in self.atlases:
+            if name in self.builtAtlases: continue
+            getAtlas(name)
+            self.builtAtlases.add(name)
+            return task.cont
+        for name in self.music:
+            if name in self.sounds: continue
+            self.sounds[name] = loader.loadMusic(name)
+            return task.cont
+        for name in self.sfx:
+            if name in self.sounds: continue
+            self.sounds[name] = loader.loadSfx(name)
+            return task.cont
+        if len(self.requests) > 0:
+            # wait for the models before creating the actors
+            return task.cont
+        for cls in self.actorClasses:
+            if self.actorPool.hasFree(cls): continue
+            self.actorPool.warm(cls)
+            return task.cont
+        logging.info("prefetching done")
+        self.running = False
+        return task.done
+
+    def isModelLoaded(self, name):
+        return name in self.loadedModels
+
+    def takeSound(self, name):
+        """Hand over the prefetched sound with the given name or return None
+        if it hasn't been loaded yet"""
+        sound = self.sounds.pop(name, None)
+        if sound is not None and sound.status() == AudioSound.BAD:
+            return None
+        return sound
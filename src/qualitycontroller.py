@@ -0,0 +1,135 @@
+"""Watch the frame time while the game runs and lower or raise the rendering
+quality to stay within the frame time budget"""
+import logging
+from panda3d.core import (
+    ConfigVariableBool,
+    ConfigVariableDouble)
+from resolutionscaler import ResolutionScaler
+
+# the quality levels from the lowest to the highest, each one with
+# (particle density, lights per object, actor LOD scale, resolution scale,
+#  frame blending), None lights uses the configured number of lights
+LEVELS = [
+    (0.25, 1, 0.4, 0.5, False),
+    (0.5, 2, 0.6, 0.7, False),
+    (0.75, 3, 0.8, 0.85, False),
+    (1.0, 3, 1.0, 1.0, True),
+    (1.0, None, 1.0, 1.0, True)]
+
+
+class QualityController():
+    # time in seconds over which the frame time will be averaged
+    WINDOW = 1.0
+    # the average frame time has to be above budget * DOWNFACTOR to lower
+    # the quality and below budget * UPFACTOR to raise it again
+    DOWNFACTOR = 1.1
+    UPFACTOR = 0.7
+    # with video sync the frames can't be faster than the refresh interval,
+    # frames within this factor of it are waiting for the display and count
+    # as fast enough to raise the quality
+    SYNCFACTOR = 1.05
+    # the number of measuring windows in a row needed to change the level,
+    # raising needs more to not switch back and forth
+    DOWNWINDOWS = 2
+    UPWINDOWS = 5
+
+    def __init__(self, particleLOD, lightAssigner, actorLOD):
+        self.enabled = ConfigVariableBool("adaptive-quality", True).getValue()
+        # the frame time budget in milliseconds
+        self.budget = ConfigVariableDouble("frame-time-budget", 16.7).getValue()
+        # the shortest possible frame time in milliseconds
+        self.refreshTime = 0.0
+        if ConfigVariableBool("sync-video", True).getValue():
+            refreshRate = ConfigVariableDouble("display-refresh-rate", 60.0).getValue()
+            self.refreshTime = 1000.0 / max(1.0, refreshRate)
+            # a budget below the refresh interval can never be met
+            self.budget = max(self.budget, self.refreshTime)
+        self.downTime = self.budget * QualityController.DOWNFACTOR
+        self.upTime = max(
+            self.budget * QualityController.UPFACTOR,
+            self.refreshTime * QualityController.SYNCFACTOR)
+        self.particleLOD = particleLOD
+        self.lightAssigner = lightAssigner
+        self.actorLOD = actorLOD
+        self.resolutionScaler = ResolutionScaler()
+        self.maxLights = lightAssigner.maxLights
+        self.level = len(LEVELS) - 1
+        self.frameTime = 0.0
+        self.windowTime = 0.0
+        self.windowFrames = 0
+        self.slowWindows = 0
+        self.fastWindows = 0
+
+    def start(self):
+        base.qualityController = self
+        if not self.enabled: return
+        self.__apply()
+        self.windowTime = 0.0
+        self.windowFrames = 0
+        taskMgr.add(self.update, "qualityControllerTask", sort=50)
+
+    def stop(self):
+        taskMgr.remove("qualityControllerTask")
+        self.resolutionScaler.cleanup()
+        base.qualityController = None
+
+    def setLevel(self, level):
+        level = max(0, min(level, len(LEVELS) - 1))
+        if level == self.level: return
+        logging.info("change quality level from %d to %d at %0.1f ms" % (
+            self.level, level, self.frameTime))
+        self.level = level
+        self.slowWindows = 0
+        self.fastWindows = 0
+        self.__apply()
+
+    def __apply(self):
+        particles, lights, actorScale, resolution, frameBlend = LEVELS[self.level]
+        self.particleLOD.setDensity(particles)
+        self.lightAssigner.setMaxLights(self.__getLights(lights))
+        self.actorLOD.setScale(actorScale)
+        self.actorLOD.setFrameBlend(frameBlend)
+        self.resolutionScaler.setScale(resolution)
+
+    def __getLights(self, lights):
+        if lights is None:
+            return self.maxLights
+        return min(lights, self.maxLights)
+
+    def update(self, task):
+        self.windowTime += globalClock.getDt()
+        self.windowFrames += 1
+        if self.windowTime < QualityController.WINDOW:
+            return task.cont
+        self.frameTime = self.windowTime * 1000.0 / self.windowFrames
+        self.windowTime = 0.0
+        self.windowFrames = 0
+        if self.frameTime > self.downTime:
+            self.slowWindows += 1
+            self.fastWindows = 0
+        elif self.frameTime < self.upTime:
+            self.fastWindows += 1
+            self.slowWindows = 0
+        else:
+            self.slowWindows = 0
+            self.fastWindows = 0
+        if self.slowWindows >= QualityController.DOWNWINDOWS:
+            self.setLevel(self.level - 1)
+        elif self.fastWindows >= QualityController.UPWINDOWS:
+            self.setLevel(self.level + 1)
+        return task.cont
+
+    def getStatusText(self):
+        """Return a description of the current decisions for the debug
+        overlay"""
+        particles, lights, actorScale, resolution, frameBlend = LEVELS[self.level]
+        return "\n".join([
+            "quality level %d/%d%s" % (
+                self.level, len(LEVELS) - 1,
+                "" if self.enabled else " (fixed)"),
+            "frame time %0.1f / %0.1f ms" % (self.frameTime, self.budget),
+            "particle density %0.2f" % particles,
+            "lights per object %d" % self.__getLights(lights),
+            "actor lod scale %0.2f" % actorScale,
+            "resolution scale %0.2f" % resolution,
+            "frame blending %s" % ("on" if frameBlend else "off")])
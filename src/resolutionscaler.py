@@ -0,0 +1,67 @@
+"""Render the 3D scene at a lower resolution than the window and scale it up,
+the GUI will still be rendered at the full window resolution"""
+from direct.showbase.DirectObject import DirectObject
+from panda3d.core import Texture
+
+
+class ResolutionScaler(DirectObject):
+    def __init__(self):
+        self.scale = 1.0
+        self.buffer = None
+        self.sceneCam = None
+        self.card = None
+
+    def setScale(self, scale):
+        """Set the resolution of the scene relative to the window size, one
+        renders straight into the window again"""
+        if scale == self.scale: return
+        self.scale = scale
+        self.__setup()
+
+    def cleanup(self):
+        self.scale = 1.0
+        self.__teardown()
+
+    def __setup(self):
+        self.__teardown()
+        if self.scale >= 1.0: return
+        width = max(1, int(base.win.getXSize() * self.scale))
+        height = max(1, int(base.win.getYSize() * self.scale))
+        tex = Texture("scaledScene")
+        self.buffer = base.win.makeTextureBuffer("scaledScene", width, height, tex)
+        if self.buffer is None:
+            self.scale = 1.0
+            return
+        self.buffer.setSort(-100)
+        self.buffer.setClearColor(base.win.getClearColor())
+        self.sceneCam = base.makeCamera(self.buffer, lens=base.camLens)
+        self.sceneCam.node().setScene(render)
+        # show the scene behind everything else of the 2D scene graph
+        self.card = self.buffer.getTextureCard()
+        self.card.reparentTo(render2d)
+        self.card.setBin("background", -100)
+        self.card.setDepthWrite(False)
+        base.camNode.setActive(False)
+        self.accept("window-event", self.__windowEvent)
+
+    def __teardown(self):
+        self.ignore("window-event")
+        if self.buffer is None: return
+        base.camNode.setActive(True)
+        self.card.removeNode()
+        self.card = None
+        # the camera has been added to the camera list by makeCamera
+        if self.sceneCam in base.camList:
+            base.camList.remove(self.sceneCam)
+        self.sceneCam.removeNode()
+        self.sceneCam = None
+        base.graphicsEngine.removeWindow(self.buffer)
+        self.buffer = None
+
+    def __windowEvent(self, window):
+        if window != base.win or self.buffer is None: return
+        width = max(1, int(base.win.getXSize() * self.scale))
+        height = max(1, int(base.win.getYSize() * self.scale))
+        if width == self.buffer.getXSize() and height == self.buffer.getYSize():
+            return
+        self.__setup()
@@ -0,0 +1,115 @@
+"""Run the gameplay simulation with a fixed time step. The movement, the AI
+and the collision traversal are stepped in ticks of the same length no matter
+how fast frames are rendered, the rendered transforms of the moving nodes are
+interpolated between the last two ticks."""
+import logging
+from panda3d.core import (
+    ConfigVariableInt,
+    TransformState,
+    Quat)
+
+
+class Simulation():
+    # the most ticks run in one frame, time beyond that will be dropped so a
+    # slow frame doesn't make the next frames even slower
+    MAXTICKS = 5
+
+    def __init__(self):
+        self.setTickRate(ConfigVariableInt("simulation-tick-rate", 60).getValue())
+        self.accumulator = 0.0
+        # the steps by their name, each one with its sort and function
+        self.steps = {}
+        self.sortedSteps = []
+        # the interpolated nodes with the transforms of the last two ticks and
+        # the transform last set for rendering
+        self.interpolated = {}
+        self.addStep("collisionTraverse", self.__traverse, sort=30)
+
+    def setTickRate(self, tickRate):
+        """Set the number of ticks per second"""
+        self.tickRate = max(1, tickRate)
+        self.dt = 1.0 / self.tickRate
+        logging.info("simulation runs with %d ticks per second" % self.tickRate)
+
+    def start(self):
+        # the collisions are traversed with the ticks instead of every frame
+        taskMgr.remove("collisionLoop")
+        # run after the intervals and before the camera and culling tasks
+        taskMgr.add(self.update, "simulationTask", sort=25)
+
+    def stop(self):
+        taskMgr.remove("simulationTask")
+
+    def addStep(self, name, function, sort=0):
+        """Call the function with the tick length on every tick, steps with
+        a lower sort run first"""
+        self.steps[name] = (sort, function)
+        self.sortedSteps = [
+            function for sort, function in sorted(self.steps.values())]
+
+    def removeStep(self, name):
+        if name not in self.steps: return
+        del self.steps[name]
+        self.sortedSteps = [
+            function for sort, function in sorted(self.steps.values())]
+
+    def addInterpolated(self, nodePath):
+        """Render the node at the interpolated position between the ticks,
+        it has to be moved by the simulation steps only"""
+        transform = nodePath.getTransform()
+        self.interpolated[nodePath] = [transform, transform, transform]
+
+    def removeInterpolated(self, nodePath):
+        if nodePath not in self.interpolated: return
+        previous, current, rendered = self.interpolated[nodePath]
+        del self.interpolated[nodePath]
+        if not nodePath.isEmpty() and nodePath.getTransform() == rendered:
+            nodePath.setTransform(current)
+
+    def __traverse(self, dt):
+        base.cTrav.traverse(render)
+
+    def update(self, task):
+        # give the nodes their simulated transforms back, nodes which have
+        # been moved outside of the simulation keep their new transform
+        for nodePath, transforms in self.interpolated.items():
+            if nodePath.isEmpty(): continue
+            transform = nodePath.getTransform()
+            if transform == transforms[2]:
+                nodePath.setTransform(transforms[1])
+            else:
+                transforms[0] = transform
+                transforms[1] = transform
+        self.accumulator += globalClock.getDt()
+        ticks = 0
+        while self.accumulator >= self.dt and ticks < Simulation.MAXTICKS:
+            for nodePath, transforms in self.interpolated.items():
+                if nodePath.isEmpty(): continue
+                transforms[0] = nodePath.getTransform()
+            for function in self.sortedSteps:
+                function(self.dt)
+            for nodePath, transforms in self.interpolated.items():
+                if nodePath.isEmpty(): continue
+                transforms[1] = nodePath.getTransform()
+            self.accumulator -= self.dt
+            ticks += 1
+        if ticks == Simulation.MAXTICKS:
+            self.accumulator = min(self.accumulator, self.dt)
+        alpha = self.accumulator / self.dt
+        for nodePath, transforms in self.interpolated.items():
+            if nodePath.isEmpty(): continue
+            transforms[2] = self.__interpolate(transforms[0], transforms[1], alpha)
+            nodePath.setTransform(transforms[2])
+        return task.cont
+
+    def __interpolate(self, previous, current, alpha):
+        if previous == current:
+            return current
+        pos = previous.getPos() + (current.getPos() - previous.getPos()) * alpha
+        q1 = previous.getQuat()
+        q2 = current.getQuat()
+        if q1.dot(q2) < 0:
+            q2 = -q2
+        quat = Quat(q1 * (1.0 - alpha) + q2 * alpha)
+        quat.normalize()
+        return TransformState.makePosQuatScale(pos, quat, current.getScale())
@@ -0,0 +1,91 @@
+"""Measure the cost of skinning by rendering a growing number of animated
+golems in front of the camera, each count once with the full model and once
+with the lowest level of detail"""
+import logging
+from golem import Golem
+import actorlod
+
+
+class SkinningBenchmark():
+    # the numbers of golems to measure
+    COUNTS = [1, 4, 8, 16]
+    # time in seconds before the measuring of a run starts
+    WARMUP = 0.5
+    # time in seconds each run will be measured
+    DURATION = 3.0
+    # distance between the golems and in front of the camera
+    SPACING = 2.0
+
+    def __init__(self):
+        self.runs = []
+        for count in SkinningBenchmark.COUNTS:
+            self.runs.append((count, "high"))
+            self.runs.append((count, actorlod.LODS[-1][0]))
+        self.results = []
+        self.golems = []
+        self.runIndex = 0
+        self.runStart = 0.0
+        self.frames = 0
+
+    def start(self):
+        logging.info("start skinning benchmark")
+        self.results = []
+        self.__startRun(0)
+
+    def stop(self):
+        taskMgr.remove("skinningBenchmarkTask")
+        self.__removeGolems()
+
+    def __removeGolems(self):
+        for golem in self.golems:
+            golem.cleanup()
+            golem.removeNode()
+        self.golems = []
+
+    def __startRun(self, index):
+        self.__removeGolems()
+        if index >= len(self.runs):
+            self.__report()
+            return
+        count, lodName = self.runs[index]
+        lodNames = [lod[0] for lod in actorlod.LODS]
+        center = render.getRelativePoint(base.camera, (0, 10, 0))
+        rowLength = int(count ** 0.5 + 0.99)
+        for i in range(count):
+            golem = actorlod.loadActor("Golem", Golem.animations)
+            golem.setBlend(frameBlend=True)
+            golem.setPos(
+                center.getX() + (i % rowLength - rowLength / 2.0) * SkinningBenchmark.SPACING,
+                center.getY() + (i / rowLength) * SkinningBenchmark.SPACING,
+                center.getZ() - 1.0)
+            golem.reparentTo(render)
+            golem.loop("Walk")
+            if golem.hasLOD():
+                golem.getLODNode().node().forceSwitch(lodNames.index(lodName))
+            self.golems.append(golem)
+        self.runIndex = index
+        self.runStart = globalClock.getRealTime()
+        self.frames = 0
+        taskMgr.add(self.__measureTask, "skinningBenchmarkTask")
+
+    def __measureTask(self, task):
+        elapsed = globalClock.getRealTime() - self.runStart
+        if self.frames == 0:
+            if elapsed >= SkinningBenchmark.WARMUP:
+                # the warmup is done, start counting from here
+                self.runStart = globalClock.getRealTime()
+                self.frames = 1
+            return task.cont
+        if elapsed < SkinningBenchmark.DURATION:
+            self.frames += 1
+            return task.cont
+        count, lodName = self.runs[self.runIndex]
+        self.results.append((count, lodName, elapsed * 1000.0 / self.frames))
+        self.__startRun(self.runIndex + 1)
+        return task.done
+
+    def __report(self):
+        lines = ["skinning benchmark:"]
+        for count, lodName, frameTime in self.results:
+            lines.append("  %2d golems %-8s %8.2f ms/frame" % (count, lodName, frameTime))
+        logging.info("\n".join(lines))
@@ -0,0 +1,31 @@
+"""Measure the time the single phases of the application startup take until
+the first frame is rendered"""
+import time
+import logging
+
+
+class StartupTimer():
+    def __init__(self, startTime):
+        """startTime - the time.time() value taken as early as possible on
+        application start"""
+        self.startTime = startTime
+        self.lastMark = startTime
+        self.phases = []
+
+    def mark(self, phase):
+        """Finish the current phase with the given name, the next phase
+        starts right now"""
+        now = time.time()
+        self.phases.append((phase, now - self.lastMark))
+        self.lastMark = now
+
+    def getTotal(self):
+        return self.lastMark - self.startTime
+
+    def report(self):
+        """Write the timing breakdown of all phases to the log"""
+        lines = ["startup timing:"]
+        for phase, duration in self.phases:
+            lines.append("  %-16s %8.1f ms" % (phase, duration * 1000.0))
+        lines.append("  %-16s %8.1f ms" % ("total", self.getTotal() * 1000.0))
+        logging.info("\n".join(lines))
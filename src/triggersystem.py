@@ -0,0 +1,208 @@
+"""Trigger volumes the player can walk into. The volumes are sorted into a
+grid of cells on the ground plane, so every simulation tick only the triggers
+of the cells the tracked objects are in will be tested, the callbacks are
+called directly when a tracked object enters or leaves a volume."""
+import logging
+from panda3d.core import (
+    Point3,
+    Mat4)
+
+
+class Trigger():
+    SPHERE = 0
+    BOX = 1
+    PLANE = 2
+
+    def __init__(self, shape, parent, data, callback, extraArgs, dynamic):
+        self.shape = shape
+        self.parent = parent
+        # center and radius of spheres, the min and max point of boxes or the
+        # plane, all of them relative to the parent
+        self.data = data
+        self.callback = callback
+        self.extraArgs = extraArgs
+        # dynamic triggers move with their parent and aren't in the grid
+        self.dynamic = dynamic
+        self.enabled = True
+        # the sphere center and radius in render space or the transform from
+        # render into the space of the parent for boxes and planes
+        self.center = None
+        self.radius = 0.0
+        self.invMat = None
+        self.cells = []
+
+    def updateTransform(self):
+        mat = self.parent.getMat(render)
+        if self.shape == Trigger.SPHERE:
+            center, radius = self.data
+            self.center = mat.xformPoint(center)
+            self.radius = radius * mat.getRow3(0).length()
+        else:
+            self.invMat = Mat4(mat)
+            self.invMat.invertInPlace()
+            # the scale to bring a tracker radius into the parent space
+            self.radius = 1.0 / max(0.0001, mat.getRow3(0).length())
+
+    def getBounds(self):
+        """Return the min and max point of the trigger in render space"""
+        if self.shape == Trigger.SPHERE:
+            r = self.radius
+            return (
+                Point3(self.center.getX() - r, self.center.getY() - r, self.center.getZ() - r),
+                Point3(self.center.getX() + r, self.center.getY() + r, self.center.getZ() + r))
+        p1, p2 = self.data
+        mat = self.parent.getMat(render)
+        corners = [mat.xformPoint(Point3(x, y, z))
+                   for x in (p1.getX(), p2.getX())
+                   for y in (p1.getY(), p2.getY())
+                   for z in (p1.getZ(), p2.getZ())]
+        return (
+            Point3(min(c.getX() for c in corners),
+                   min(c.getY() for c in corners),
+                   min(c.getZ() for c in corners)),
+            Point3(max(c.getX() for c in corners),
+                   max(c.getY() for c in corners),
+                   max(c.getZ() for c in corners)))
+
+    def contains(self, point, radius):
+        """Check if a sphere given in render space touches the trigger"""
+        if self.shape == Trigger.SPHERE:
+            r = self.radius + radius
+            return (point - self.center).lengthSquared() <= r * r
+        p = self.invMat.xformPoint(point)
+        r = radius * self.radius
+        if self.shape == Trigger.PLANE:
+            return self.data.distToPlane(p) <= r
+        p1, p2 = self.data
+        return (p1.getX() - r <= p.getX() <= p2.getX() + r
+                and p1.getY() - r <= p.getY() <= p2.getY() + r
+                and p1.getZ() - r <= p.getZ() <= p2.getZ() + r)
+
+
+class Tracker():
+    def __init__(self, nodePath, center, radius):
+        self.nodePath = nodePath
+        self.center = center
+        self.radius = radius
+        # the triggers the tracker is inside of
+        self.inside = set()
+
+
+class TriggerSystem():
+    # the size of the grid cells in units
+    CELLSIZE = 4.0
+    # the largest radius a tracker may have, the triggers are sorted into all
+    # cells they come closer than this to, so only one cell has to be tested
+    MAXRADIUS = 1.0
+
+    def __init__(self):
+        # the static triggers by the (x, y) index of the cell
+        self.cells = {}
+        self.dynamic = []
+        # triggers without bounds like planes, always tested
+        self.unbounded = []
+        self.trackers = []
+
+    def start(self):
+        # run after the movement of the player and the collision traversal
+        base.simulation.addStep("triggerSystem", self.update, sort=35)
+
+    def stop(self):
+        base.simulation.removeStep("triggerSystem")
+
+    def addSphere(self, parent, center, radius, callback, extraArgs=[], dynamic=False):
+        """Add a sphere relative to the parent. The callback will be called
+        with True and the extraArgs if a tracker enters it and with False
+        if it leaves it again. Dynamic triggers may move with their
+        parent."""
+        return self.__add(Trigger(
+            Trigger.SPHERE, parent, (Point3(center), radius),
+            callback, extraArgs, dynamic))
+
+    def addBox(self, parent, p1, p2, callback, extraArgs=[], dynamic=False):
+        """Add an axis aligned box between the min and max point relative to
+        the parent"""
+        return self.__add(Trigger(
+            Trigger.BOX, parent, (Point3(p1), Point3(p2)),
+            callback, extraArgs, dynamic))
+
+    def addPlane(self, parent, plane, callback, extraArgs=[]):
+        """Add a plane, everything behind it counts as inside"""
+        trigger = Trigger(Trigger.PLANE, parent, plane, callback, extraArgs, False)
+        trigger.updateTransform()
+        self.unbounded.append(trigger)
+        return trigger
+
+    def __add(self, trigger):
+        trigger.updateTransform()
+        if trigger.dynamic:
+            self.dynamic.append(trigger)
+            return trigger
+        bmin, bmax = trigger.getBounds()
+        margin = TriggerSystem.MAXRADIUS
+        x1, y1 = self.__getCell(bmin.getX() - margin, bmin.getY() - margin)
+        x2, y2 = self.__getCell(bmax.getX() + margin, bmax.getY() + margin)
+        for x in range(x1, x2 + 1):
+            for y in range(y1, y2 + 1):
+                self.cells.setdefault((x, y), []).append(trigger)
+                trigger.cells.append((x, y))
+        return trigger
+
+    def removeTrigger(self, trigger):
+        """Remove the trigger, trackers inside of it won't get a leave call"""
+        for cell in trigger.cells:
+            self.cells[cell].remove(trigger)
+            if not self.cells[cell]:
+                del self.cells[cell]
+        trigger.cells = []
+        if trigger in self.dynamic:
+            self.dynamic.remove(trigger)
+        if trigger in self.unbounded:
+            self.unbounded.remove(trigger)
+        for tracker in self.trackers:
+            tracker.inside.discard(trigger)
+
+    def setEnabled(self, trigger, enabled):
+        """Disabled triggers will be ignored, trackers which are inside will
+        be handled as if they had left it without calling the callback"""
+        trigger.enabled = enabled
+        if not enabled:
+            for tracker in self.trackers:
+                tracker.inside.discard(trigger)
+
+    def addTracker(self, nodePath, center, radius):
+        """Test a sphere relative to the given node against the triggers"""
+        if radius > TriggerSystem.MAXRADIUS:
+            logging.warning("tracker radius %f is larger than %f" % (
+                radius, TriggerSystem.MAXRADIUS))
+        self.trackers.append(Tracker(nodePath, Point3(center), radius))
+
+    def removeTracker(self, nodePath):
+        self.trackers = [t for t in self.trackers if t.nodePath != nodePath]
+
+    def __getCell(self, x, y):
+        return (
+            int(x // TriggerSystem.CELLSIZE),
+            int(y // TriggerSystem.CELLSIZE))
+
+    def update(self, dt):
+        for trigger in self.dynamic:
+            if trigger.enabled and not trigger.parent.isEmpty():
+                trigger.updateTransform()
+        for tracker in self.trackers:
+            if tracker.nodePath.isEmpty() or tracker.nodePath.isHidden():
+                continue
+            point = render.getRelativePoint(tracker.nodePath, tracker.center)
+            cell = self.cells.get(self.__getCell(point.getX(), point.getY()), [])
+            inside = set()
+            for triggers in (cell, self.dynamic, self.unbounded):
+                for trigger in triggers:
+                    if trigger.enabled and trigger.contains(point, tracker.radius):
+                        inside.add(trigger)
+            left = tracker.inside - inside
+            entered = inside - tracker.inside
+            tracker.inside = inside
+            for trigger in left:
+                trigger.callback(False, *trigger.extraArgs)
+            for trigger in entered:
+                trigger.callback(True, *trigger.extraArgs)
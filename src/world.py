@@ -5,52 +5,125 @@ from gui.textfield import MessageWriter
 from gui.hud import PlayerHUD
 from gui.loadingscreen import LoadingScreen
 from gui.gameOverScreen import GameOverScreen
+from worldloader import WorldLoader
+from actorlod import ActorLOD
+from qualitycontroller import QualityController
 from direct.showbase.DirectObject import DirectObject
 from direct.interval.LerpInterval import LerpFunc
 from direct.interval.IntervalGlobal import Sequence
 from direct.interval.FunctionInterval import Func
 import helper
+import logging
 import time
 
 class World(DirectObject):
-    def __init__(self):
+    # sounds loaded by the world, they are counted to the loading progress
+    musicFiles = [
+        "MayanJingle1_Ambient.ogg",
+        "MayanJingle3_Fight.ogg",
+        "MayanJingle5_GameOver.ogg"]
+    sfxFiles = [
+        "MayanJingle4_PuzzleSolved.ogg",
+        "MayanJingle2_GetItem.ogg"]
+
+    def __init__(self, actorPool, prefetcher):
+        # the pool the player and golem will be taken from and given back to
+        self.actorPool = actorPool
+        # assets which have been loaded while the menu was shown
+        self.prefetcher = prefetcher
         self.loadingscreen = LoadingScreen()
-        self.loadingscreen.show()
         self.gameoverscreen = GameOverScreen()
+        self.level = None
+        self.player = None
+        self.golem = None
+        self.msgWriter = None
+        self.hud = None
+        self.started = False
+        self.worldLoader = None
+        # frame blending and detail distances of the actors
+        self.actorLOD = ActorLOD()
+        self.qualityController = None
+
+    def load(self):
+        """Load all the world content in the background while the loading
+        screen is shown and start the world as soon as everything is done"""
+        self.loadingscreen.show()
+        models = list(Level01.models)
+        # pooled actors are already loaded
+        if not self.actorPool.hasFree(Player):
+            models += Player.models
+        if not self.actorPool.hasFree(Golem):
+            models += Golem.models
+        models = [name for name in models if not self.prefetcher.isModelLoaded(name)]
+        steps = [
+            (self.__createLevel, []),
+            (self.__createPlayer, []),
+            (self.__createGolem, []),
+            (self.__createGui, []),
+            (self.__loadMusic, World.musicFiles + World.sfxFiles)]
+        self.worldLoader = WorldLoader(
+            models,
+            steps,
+            self.loadingscreen.setLoadingValue,
+            self.start)
+        self.worldLoader.start()
+
+    def __createLevel(self):
         self.level = Level01()
-        self.loadingscreen.setLoadingValue(10)
-        self.player = Player()
-        self.loadingscreen.setLoadingValue(15)
-        self.golem = Golem()
-        self.loadingscreen.setLoadingValue(20)
+
+    def __createPlayer(self):
+        self.player = self.actorPool.acquire(Player)
+
+    def __createGolem(self):
+        self.golem = self.actorPool.acquire(Golem)
+
+    def __createGui(self):
         self.msgWriter = MessageWriter()
-        self.loadingscreen.setLoadingValue(25)
         self.hud = PlayerHUD()
-        self.loadingscreen.setLoadingValue(30)
 
-        self.musicAmbient = loader.loadMusic("MayanJingle1_Ambient.ogg")
+    def __getSound(self, name, loadFunc):
+        """Take the prefetched sound or load it if it isn't available"""
+        sound = self.prefetcher.takeSound(name)
+        if sound is None:
+            sound = loadFunc(name)
+        return sound
+
+    def __loadMusic(self):
+        self.musicAmbient = self.__getSound("MayanJingle1_Ambient.ogg", loader.loadMusic)
         self.musicAmbient.setLoop(True)
         self.musicAmbient.setVolume(1.0)
-        self.musicFight = loader.loadMusic("MayanJingle3_Fight.ogg")
+        self.musicFight = self.__getSound("MayanJingle3_Fight.ogg", loader.loadMusic)
         self.musicFight.setLoop(True)
         self.musicFight.setVolume(1.0)
-        self.musicGameOver = loader.loadMusic("MayanJingle5_GameOver.ogg")
+        self.musicGameOver = self.__getSound("MayanJingle5_GameOver.ogg", loader.loadMusic)
         self.musicGameOver.setVolume(1.0)
-        self.puzzleSolved = loader.loadSfx("MayanJingle4_PuzzleSolved.ogg")
-        self.getItem = loader.loadSfx("MayanJingle2_GetItem.ogg")
-        self.loadingscreen.setLoadingValue(40)
+        self.puzzleSolved = self.__getSound("MayanJingle4_PuzzleSolved.ogg", loader.loadSfx)
+        self.getItem = self.__getSound("MayanJingle2_GetItem.ogg", loader.loadSfx)
 
     def start(self):
+        self.worldLoader = None
         helper.hide_cursor()
         self.level.start()
-        self.loadingscreen.setLoadingValue(55)
         self.player.start(self.level.getPlayerStartPoint())
-        self.loadingscreen.setLoadingValue(65)
+        self.player.setHeightField(self.level.heightField)
+        self.player.setLedgeGraph(self.level.ledgeGraph)
+        self.level.addViewer(self.player.player)
+        self.level.addMover(self.player.player)
         self.hud.show()
+        self.hud.setHealthStatus(self.player.health)
         self.hud.updateKeyCount(0)
-        self.loadingscreen.setLoadingValue(75)
         self.golem.start(self.level.getGolemStartPoint())
-        self.loadingscreen.setLoadingValue(85)
+        self.golem.setHeightField(self.level.heightField)
+        self.level.addMover(self.golem.golem)
+        self.actorLOD.addActor(self.player.player)
+        self.actorLOD.addActor(self.golem.golem)
+        self.actorLOD.start()
+        # keep the frame time within the budget
+        self.qualityController = QualityController(
+            self.level.particleLOD,
+            self.level.lightAssigner,
+            self.actorLOD)
+        self.qualityController.start()
 
         self.playMusic("Ambient")
 
@@ -74,15 +147,52 @@ class World(DirectObject):
         self.accept("GolemDestroyed", self.exitFight)
         self.accept("GameOver", self.gameOver)
         self.accept("Exit", base.messenger.send, ["escape"])
-        self.loadingscreen.setLoadingValue(100)
+        self.accept("PlayAgain", self.restart)
+        # upload everything to the graphics card while the loading screen
+        # still covers the scene, to not stutter on the first frames
+        numPrepared, prepareTime = helper.prepareGraphics([render, render2d])
+        logging.info("prepared %d graphics objects in %0.1f ms" % (
+            numPrepared, prepareTime * 1000.0))
         self.loadingscreen.hide()
+        self.started = True
         self.startTime = time.time()
         base.messenger.send(
             "showMessage",
             [_("Welcome to path of Kings, follow the signposts and try to survive this dungeon.\nmove with the arrow keys or w a s d\n\nGood luck...")])
 
+    def restart(self):
+        """Start a new game in the already loaded world, the level and actors
+        will be reset in place instead of loading them again"""
+        helper.hide_cursor()
+        self.gameoverscreen.hide()
+        self.msgWriter.clear()
+        self.player.reset()
+        self.golem.reset()
+        self.level.reset()
+        self.player.start(self.level.getPlayerStartPoint())
+        self.golem.start(self.level.getGolemStartPoint())
+        self.hud.setHealthStatus(self.player.health)
+        self.hud.updateKeyCount(0)
+        self.hud.hideActionKey()
+        self.playMusic("Ambient")
+        self.startTime = time.time()
+
     def stop(self):
         helper.show_cursor()
+        if self.worldLoader is not None:
+            # the world is still loading
+            self.worldLoader.cancel()
+            self.worldLoader = None
+            self.loadingscreen.hide()
+        if not self.started:
+            # the loader may have created the level before it was cancelled
+            if self.level is not None:
+                self.level.stop()
+                self.level = None
+            return
+        self.started = False
+        self.qualityController.stop()
+        self.actorLOD.stop()
         self.level.stop()
         self.player.stop()
         self.golem.stop()
@@ -94,10 +204,13 @@ class World(DirectObject):
         self.musicFight.stop()
 
     def cleanup(self):
-        self.player.cleanup()
-        del self.player
-        self.golem.cleanup()
-        del self.golem
+        # the actors will be reused by the next world
+        if self.player is not None:
+            self.actorPool.release(self.player)
+            self.player = None
+        if self.golem is not None:
+            self.actorPool.release(self.golem)
+            self.golem = None
         base.cTrav.clearColliders()
 
     def enterFight(self):
@@ -0,0 +1,108 @@
+"""Load the assets of the world in the background while the main loop keeps
+running, so the loading screen stays responsive and shows the real progress"""
+import logging
+from panda3d.core import (
+    Filename,
+    VirtualFileSystem,
+    ConfigVariableString,
+    getModelPath)
+
+
+def getAssetSize(name):
+    """Return the size in bytes of the file the given model or sound name
+    will be loaded from, or 1 if the file can't be found"""
+    fn = Filename(name)
+    if fn.getExtension() == "":
+        ext = ConfigVariableString("default-model-extension", ".egg").getValue()
+        fn = Filename(name + ext)
+    vfs = VirtualFileSystem.getGlobalPtr()
+    if vfs.resolveFilename(fn, getModelPath().getValue()):
+        return max(1, vfs.getFile(fn).getFileSize())
+    return 1
+
+
+class WorldLoader():
+    # the part of the waitbar used for the file loading phase, the rest
+    # is used by the setup steps that create the world objects
+    FILESHARE = 90.0
+
+    def __init__(self, models, steps, progressFunc, doneFunc):
+        """models - list of model and animation files which will be loaded
+                    asynchronously into the model pool
+        steps - list of (function, files) tuples. The functions are called
+                one per frame after all models are loaded to create the
+                world objects, files are the names of the files the
+                function loads itself, like sounds.
+        progressFunc - called with a value from 0 to 100
+        doneFunc - called after the last step has been run"""
+        self.models = models
+        self.steps = steps
+        self.progressFunc = progressFunc
+        self.doneFunc = doneFunc
+        self.requests = []
+        self.sizes = {}
+        for name in models:
+            self.sizes[name] = getAssetSize(name)
+        for func, files in steps:
+            for name in files:
+                self.sizes[name] = getAssetSize(name)
+        self.totalBytes = max(1, sum(self.sizes.values()))
+        self.doneBytes = 0
+        self.numModelsDone = 0
+        self.currentStep = 0
+
+    def start(self):
+        """Start loading all models in the background"""
+        self.progressFunc(0)
+        if len(self.models) == 0:
+            self.__startSteps()
+            return
+        for name in self.models:
+            request = loader.loadModel(
+                name,
+                callback=self.__modelDone,
+                extraArgs=[name])
+            self.requests.append(request)
+
+    def cancel(self):
+        """Stop loading, already loaded files stay in the model pool"""
+        for request in self.requests:
+            loader.cancelRequest(request)
+        self.requests = []
+        taskMgr.remove("worldLoaderSteps")
+
+    def __modelDone(self, model, name):
+        if model is None:
+            logging.error("could not load %s" % name)
+        self.doneBytes += self.sizes[name]
+        self.numModelsDone += 1
+        self.__updateProgress()
+        if self.numModelsDone == len(self.models):
+            self.requests = []
+            self.__startSteps()
+
+    def __startSteps(self):
+        taskMgr.add(self.__runStep, "worldLoaderSteps")
+
+    def __runStep(self, task):
+        """Run one setup step per frame so the loading screen gets
+        rendered between them"""
+        if self.currentStep >= len(self.steps):
+            self.progressFunc(100)
+            self.doneFunc()
+            return task.done
+        func, files = self.steps[self.currentStep]
+        func()
+        for name in files:
+            self.doneBytes += self.sizes[name]
+        self.currentStep += 1
+        self.__updateProgress()
+        return task.cont
+
+    def __updateProgress(self):
+        value = self.doneBytes / float(self.totalBytes) * WorldLoader.FILESHARE
+        if len(self.steps) > 0:
+            value += self.currentStep / float(len(self.steps)) * (100 - WorldLoader.FILESHARE)
+        else:
+            value += 100 - WorldLoader.FILESHARE
+        self.progressFunc(int(value))